@@ -17,9 +17,22 @@ import subprocess
 import traceback
 import json
 import re
+import uuid
+import hashlib
+import zlib
+import sqlite3
+import shutil
+import atexit
+import argparse
+import tempfile
+import bisect
 from pathlib import Path
-from datetime import datetime
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from queue import Queue
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 
 # ============================================
 # PAKETLAR TEKSHIRUVI
@@ -38,7 +51,7 @@ except ImportError:
     missing.append("schedule")
 
 try:
-    from flask import Flask, jsonify, render_template, request
+    from flask import Flask, jsonify, render_template, request, Response, stream_with_context
     from flask_cors import CORS
 except ImportError:
     missing.append("flask flask-cors")
@@ -59,6 +72,7 @@ if missing:
 
 try:
     from groq import Groq
+    import httpx
 
     GROQ_AVAILABLE = True
 except ImportError:
@@ -68,14 +82,25 @@ except ImportError:
 try:
     from google.oauth2.credentials import Credentials
     from google.auth.transport.requests import Request
-    from googleapiclient.discovery import build
+    from googleapiclient.discovery import build, build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
     from googleapiclient.http import MediaFileUpload
+    from googleapiclient.errors import HttpError
+    import google_auth_httplib2
+    import httplib2
 
     GOOGLE_AVAILABLE = True
 except ImportError:
     GOOGLE_AVAILABLE = False
     print("⚠️ google-api yo'q - YouTube upload ishlamaydi")
 
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 try:
     from dotenv import load_dotenv
 
@@ -91,21 +116,100 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REFRESH_TOKEN = os.getenv("GOOGLE_REFRESH_TOKEN")
+# YouTube access token muddati tugashiga shuncha soniya qolganda yangilanadi
+YOUTUBE_TOKEN_MARGIN = int(os.getenv("YOUTUBE_TOKEN_MARGIN", "300"))
+# Resumable upload: boshlang'ich chunk (MB), bitta chunk uchun mo'ljallangan vaqt (s),
+# ketma-ket xatolar chegarasi va backoff shifti (s)
+UPLOAD_CHUNK_MB = float(os.getenv("UPLOAD_CHUNK_MB", "4"))
+UPLOAD_CHUNK_SECONDS = float(os.getenv("UPLOAD_CHUNK_SECONDS", "8"))
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "8"))
+UPLOAD_BACKOFF_CAP = float(os.getenv("UPLOAD_BACKOFF_CAP", "60"))
+
+# Groq: model, so'rov timeout'i, mavzu+scriptni bitta JSON so'rovda olish
+GROQ_MODEL = os.getenv("GROQ_MODEL", "mixtral-8x7b-32768")
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "20"))
+GROQ_COMBINED = os.getenv("GROQ_COMBINED", "1") != "0"
+
+# Montaj: bitta ffmpeg o'tishi (0 = eski ko'p bosqichli yo'l)
+SINGLE_PASS_RENDER = os.getenv("SINGLE_PASS_RENDER", "1") != "0"
+# Manba kesilganda ovoz uzunligiga qo'shiladigan zaxira (soniya)
+TRIM_MARGIN_SECONDS = float(os.getenv("TRIM_MARGIN_SECONDS", "1.0"))
+# YouTube'dan faqat kerakli bo'lakni yuklash (0 = har doim to'liq fayl)
+SECTION_DOWNLOAD = os.getenv("SECTION_DOWNLOAD", "1") != "0"
+# Bo'lak uzunligiga qo'shiladigan zaxira (keyframe va trim uchun)
+SECTION_MARGIN_SECONDS = float(os.getenv("SECTION_MARGIN_SECONDS", "3.0"))
+# Video ovoz bilan parallel yuklanadi - ovoz uzunligi noma'lum, maksimal hikoya uzunligi
+SOURCE_CLIP_SECONDS = float(os.getenv("SOURCE_CLIP_SECONDS", "30"))
+# Edge-TTS: bir vaqtdagi sintezlar, urinishlar va bitta so'rov uchun timeout
+TTS_CONCURRENCY = max(1, int(os.getenv("TTS_CONCURRENCY", "3")))
+TTS_MAX_RETRIES = max(1, int(os.getenv("TTS_MAX_RETRIES", "3")))
+TTS_TIMEOUT_SECONDS = float(os.getenv("TTS_TIMEOUT_SECONDS", "90"))
+# Parallel render worker'lar soni (har bir ish o'z katalogida - fayllar to'qnashmaydi)
+RENDER_WORKERS = max(1, int(os.getenv("RENDER_WORKERS", "2")))
+# YouTube'ga yuklovchi worker'lar soni (render'dan alohida navbat)
+UPLOAD_WORKERS = max(1, int(os.getenv("UPLOAD_WORKERS", "1")))
+# Navbatdagi (hali boshlanmagan) ishlar chegarasi
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", "20"))
+# Xotirada saqlanadigan tugagan ishlar soni
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "20"))
+# Muvaffaqiyatsiz ish checkpoint'lari (qayta urinish uchun) saqlanadigan muddat (soat)
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "48"))
+# Edge-TTS tezligi/ohangi (kesh kalitiga ham kiradi)
+TTS_RATE = os.getenv("TTS_RATE", "+0%")
+TTS_PITCH = os.getenv("TTS_PITCH", "+0Hz")
+# Ovoz keshi hajmi (MB)
+TTS_CACHE_MB = float(os.getenv("TTS_CACHE_MB", "200"))
+# Lokal klip kutubxonasi: disk kvotasi, tarmoqqa chiqmasdan oldin kerakli klip soni,
+# bitta klipdan necha marta foydalanish mumkin
+LIBRARY_QUOTA_MB = float(os.getenv("LIBRARY_QUOTA_MB", "2000"))
+LIBRARY_MIN_POOL = int(os.getenv("LIBRARY_MIN_POOL", "8"))
+LIBRARY_MAX_USES = int(os.getenv("LIBRARY_MAX_USES", "3"))
+# YouTube qidiruv natijalari keshi (soniya)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+# Mavzu indeksi: o'xshashlik chegarasi (0-1), saqlash muddati (kun), maksimal yozuvlar
+TOPIC_SIMILARITY = float(os.getenv("TOPIC_SIMILARITY", "0.7"))
+TOPIC_RETENTION_DAYS = float(os.getenv("TOPIC_RETENTION_DAYS", "30"))
+TOPIC_INDEX_MAX = int(os.getenv("TOPIC_INDEX_MAX", "5000"))
+# Oldindan tayyorlangan ish to'plamlari (kit): soni, eskirish muddati (soat), tekshirish oralig'i (s)
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "2"))
+KIT_MAX_AGE_HOURS = float(os.getenv("KIT_MAX_AGE_HOURS", "12"))
+WARM_POOL_INTERVAL = float(os.getenv("WARM_POOL_INTERVAL", "60"))
+# /api/topics: bir vaqtdagi Groq so'rovlari va bitta so'rovdagi maksimal mavzular
+TOPIC_CONCURRENCY = max(1, int(os.getenv("TOPIC_CONCURRENCY", "4")))
+TOPIC_BATCH_MAX = int(os.getenv("TOPIC_BATCH_MAX", "50"))
+# Oraliq fayllar (effekt, matn, trim) tmpfs da (/dev/shm) - disk I/O kamayadi
+SCRATCH_TMPFS = os.getenv("SCRATCH_TMPFS", "0") == "1"
+# ffmpeg: shuncha soniya oldinga siljimasa (frame/vaqt) to'xtatiladi; xato uchun stderr oxiri (qator)
+MEDIA_STALL_SECONDS = float(os.getenv("MEDIA_STALL_SECONDS", "45"))
+MEDIA_STDERR_LINES = int(os.getenv("MEDIA_STDERR_LINES", "40"))
+# Bir vaqtdagi encode'lar (0 = yadro/xotiradan avtomatik), bitta encode uchun xotira (MB),
+# fon ishlari (warm pool) ffmpeg'ining nice qiymati
+ENCODE_SLOTS = int(os.getenv("ENCODE_SLOTS", "0"))
+ENCODE_MEMORY_MB = int(os.getenv("ENCODE_MEMORY_MB", "700"))
+BACKGROUND_NICE = int(os.getenv("BACKGROUND_NICE", "10"))
+# Taxminiy YouTube yuklash tezligi (Mbit/s) - encoder benchmark baholashi uchun
+UPLOAD_MBPS = float(os.getenv("UPLOAD_MBPS", "20"))
+
 BASE_DIR = Path(__file__).parent
-OUTPUT_DIR = BASE_DIR / "output"
+OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", str(BASE_DIR / "output")))
 LOGS_DIR = BASE_DIR / "logs"
 TEMPLATES_DIR = BASE_DIR / "templates"
 STATIC_DIR = BASE_DIR / "static"
-
-for folder in [OUTPUT_DIR, LOGS_DIR, TEMPLATES_DIR, STATIC_DIR]:
+# Doimiy ma'lumotlar (keshlar) - ish tugagach o'chirilmaydi
+DATA_DIR = Path(os.getenv("DATA_DIR", str(BASE_DIR / "data")))
+TTS_CACHE_DIR = DATA_DIR / "tts_cache"
+LIBRARY_DIR = DATA_DIR / "clips"
+# Har bir ishning katalogi (checkpoint fayllari shu yerda) va tmpfs dagi oraliq fayllar ildizi
+WORKSPACE_DIR = Path(os.getenv("WORKSPACE_DIR", str(OUTPUT_DIR / "jobs")))
+SCRATCH_DIR = Path("/dev/shm/pubg-bot") if SCRATCH_TMPFS and Path("/dev/shm").is_dir() else None
+
+for folder in [OUTPUT_DIR, LOGS_DIR, TEMPLATES_DIR, STATIC_DIR, DATA_DIR, TTS_CACHE_DIR, LIBRARY_DIR, WORKSPACE_DIR]:
     folder.mkdir(parents=True, exist_ok=True)
 
 # ============================================
-# LOGGING - Thread safe
+# LOGGING
 # ============================================
 
-log_lock = threading.Lock()
-
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -117,6 +221,134 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# ============================================
+# METRIKALAR (PROMETHEUS)
+# ============================================
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def format_labels(labels):
+    """((kalit, qiymat), ...) -> {kalit="qiymat",...}"""
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    """
+    Prometheus matn formatidagi metrikalar (prometheus_client'siz)
+    - Counter va histogramlar xotirada, bitta lock ostida: yozish - lug'atda qo'shish va bisect
+    - Worker bandligi: tugagan ishlar + hozir bajarilayotganlarning o'tgan vaqti
+    - Gauge'lar (navbatlar, slotlar) faqat /metrics so'ralganda hisoblanadi
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}     # nom -> (tur, izoh, bucketlar)
+        self._values = {}   # nom -> {labels: son yoki [bucket sonlari, yig'indi, soni]}
+        self._busy = {}     # worker -> (tur, boshlangan vaqt)
+        self._busy_seconds = {}
+
+    def register(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, tuple(buckets or ()))
+        self._values[name] = {}
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._meta[name][2]
+        with self._lock:
+            series = self._values[name]
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def counters(self, name):
+        """Counter qiymatlari: {birinchi label qiymati (yoki ""): son}"""
+        with self._lock:
+            return {(key[0][1] if key else ""): value for key, value in self._values[name].items()}
+
+    @contextmanager
+    def timer(self, name, **labels):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - t0, **labels)
+
+    @contextmanager
+    def working(self, kind, worker_id):
+        """Worker ish bajarayotgan vaqt (utilizatsiya uchun)"""
+        with self._lock:
+            self._busy[worker_id] = (kind, time.time())
+        try:
+            yield
+        finally:
+            with self._lock:
+                kind, started = self._busy.pop(worker_id)
+                self._busy_seconds[kind] = self._busy_seconds.get(kind, 0.0) + time.time() - started
+
+    def busy(self):
+        """(tur -> band worker'lar, tur -> jami band soniyalar)"""
+        now = time.time()
+        with self._lock:
+            workers = {}
+            seconds = dict(self._busy_seconds)
+            for kind, started in self._busy.values():
+                workers[kind] = workers.get(kind, 0) + 1
+                seconds[kind] = seconds.get(kind, 0.0) + now - started
+        return workers, seconds
+
+    def render(self, gauges=()):
+        """Exposition format 0.0.4; gauges: [(nom, tur, izoh, [(labels dict, qiymat)])]"""
+        lines = []
+        with self._lock:
+            snapshot = {name: {k: (tuple(v[0]), v[1], v[2]) if isinstance(v, list) else v
+                               for k, v in series.items()} for name, series in self._values.items()}
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for key, value in sorted(snapshot[name].items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(key)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, n in zip(buckets + ("+Inf",), counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(key)} {round(total, 3)}")
+                lines.append(f"{name}_count{format_labels(key)} {count}")
+        for name, kind, help_text, samples in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{format_labels(tuple(sorted(labels.items())))} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.register("pubg_stage_duration_seconds", "histogram",
+                 "Ish bosqichlari davomiyligi (topic, script, audio, video, render, upload)", DURATION_BUCKETS)
+metrics.register("pubg_step_duration_seconds", "histogram",
+                 "Tashqi chaqiruvlar davomiyligi (tts, search, download)", DURATION_BUCKETS)
+metrics.register("pubg_ffmpeg_duration_seconds", "histogram", "Har bir ffmpeg o'tishi davomiyligi", DURATION_BUCKETS)
+metrics.register("pubg_ffmpeg_failures_total", "counter", "Muvaffaqiyatsiz ffmpeg o'tishlari")
+metrics.register("pubg_download_bytes_total", "counter", "Yuklab olingan gameplay baytlari")
+metrics.register("pubg_upload_bytes_total", "counter", "YouTube'ga yuborilgan baytlar")
+metrics.register("pubg_fallback_total", "counter", "Zaxira yo'llar (video, silent_audio, template_topic, template_script, multi_pass, simple_merge)")
+
+
 # ============================================
 # FFMPEG TEKSHIRUVI
 # ============================================
@@ -140,6 +372,346 @@ if not FFMPEG_AVAILABLE:
     logger.warning("Windows: https://ffmpeg.org/download.html dan yuklab, PATH ga qo'shing")
     logger.warning("Linux: sudo apt install ffmpeg")
 
+# ============================================
+# ISH KATALOGLARI (WORKSPACE)
+# ============================================
+
+class JobWorkspace:
+    """
+    Bitta ishning alohida katalogi
+    - dir: bosqich natijalari (ovoz, manba, render) - checkpoint, restartdan keyin ham kerak
+    - scratch: oraliq fayllar (trim, effekt, matn) - tmpfs bo'lishi mumkin
+    - Fayl nomlari uuid bilan - bir soniyadagi ishlar bir-birini yozib yubormaydi
+    - remove(): katalog avval rename qilinadi (atomik), keyin o'chiriladi
+    - ephemeral=False (kit): oraliq fayllar ham doimiy, alohida scratch yo'q
+    """
+
+    def __init__(self, name, ephemeral=True):
+        self.name = name
+        self.dir = WORKSPACE_DIR / name
+        # run_media uchun: bekor qilish signali, progress (0-1) qabul qiluvchi,
+        # ResourceScheduler bergan thread soni va fon (past ustuvorlik) belgisi
+        self.cancelled = threading.Event()
+        self.on_progress = None
+        self.threads = None
+        self.background = False
+        self.render_path = None  # single_pass / multi_pass / simple_merge
+        if not ephemeral:
+            self.scratch = self.dir
+        elif SCRATCH_DIR:
+            self.scratch = SCRATCH_DIR / name
+        else:
+            self.scratch = self.dir / "tmp"
+
+    def path(self, prefix, ext, scratch=False):
+        folder = self.scratch if scratch else self.dir
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder / f"{prefix}_{uuid.uuid4().hex[:12]}.{ext}"
+
+    @staticmethod
+    def _remove_tree(folder):
+        trash = folder.with_name(f".trash-{folder.name}-{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(folder, trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def clear_scratch(self):
+        if self.scratch != self.dir:
+            self._remove_tree(self.scratch)
+
+    def remove(self):
+        self.clear_scratch()
+        self._remove_tree(self.dir)
+
+    @staticmethod
+    def cleanup_stale():
+        """Ishga tushishda: chala o'chirilgan va egasiz oraliq kataloglarni tozalash"""
+        for root in filter(None, (WORKSPACE_DIR, SCRATCH_DIR)):
+            for trash in root.glob(".trash-*"):
+                shutil.rmtree(trash, ignore_errors=True)
+        if SCRATCH_DIR and SCRATCH_DIR.exists():
+            for folder in SCRATCH_DIR.iterdir():
+                shutil.rmtree(folder, ignore_errors=True)
+        for folder in WORKSPACE_DIR.glob("*/tmp"):
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def work_path(workspace, prefix, ext, scratch=False):
+    """Ish katalogidagi yangi fayl yo'li (workspace yo'q bo'lsa OUTPUT_DIR da, uuid nom)"""
+    if workspace is None:
+        return OUTPUT_DIR / f"{prefix}_{uuid.uuid4().hex[:12]}.{ext}"
+    return workspace.path(prefix, ext, scratch=scratch)
+
+
+# ============================================
+# FFMPEG JARAYONLARI (STREAMING RUNNER)
+# ============================================
+
+class MediaError(Exception):
+    """ffmpeg muvaffaqiyatsiz: xato kodi, to'xtab qolish yoki bekor qilish (tail - stderr oxiri)"""
+
+    def __init__(self, message, returncode=None, tail=""):
+        super().__init__(f"{message}: {tail[-300:]}" if tail else message)
+        self.returncode = returncode
+        self.tail = tail
+
+
+class MediaCancelled(MediaError):
+    """Ish bekor qilindi"""
+
+
+def run_media(cmd, workspace=None, duration=None, stall_timeout=None, op="other"):
+    """
+    ffmpeg ni oqim rejimida ishga tushirish (subprocess.run(capture_output) o'rniga)
+    - -progress pipe:1 dan frame/out_time o'qiladi; duration berilsa
+      workspace.on_progress(0-1) ga sekundiga ko'pi bilan bir marta yuboriladi
+    - Umumiy timeout yo'q: stall_timeout soniya oldinga siljimasa jarayon o'ldiriladi
+    - stderr dan faqat oxirgi MEDIA_STDERR_LINES qator saqlanadi
+    - workspace.cancelled o'rnatilsa jarayon darhol to'xtatiladi
+    - op: metrikalardagi o'tish nomi (pubg_ffmpeg_duration_seconds{op=...})
+    Natija: {"frames", "out_time"} - progress oqimidagi oxirgi qiymatlar
+    Xato bo'lsa MediaError (MediaCancelled) ko'tariladi
+    """
+    stall_timeout = stall_timeout or MEDIA_STALL_SECONDS
+    cancelled = workspace.cancelled if workspace is not None else threading.Event()
+    on_progress = workspace.on_progress if workspace is not None else None
+    if cancelled.is_set():
+        raise MediaCancelled("Bekor qilindi")
+
+    args = [str(c) for c in cmd[1:]]
+    prefix = [cmd[0], '-hide_banner', '-nostats', '-progress', 'pipe:1']
+    threads = workspace.threads if workspace is not None else None
+    if threads:
+        # Ish ulushidan ortiq yadro olmasin: filtrlar va encoder (chiqish fayli oldidan)
+        prefix += ['-filter_threads', str(threads), '-filter_complex_threads', str(threads)]
+        args = args[:-1] + ['-threads', str(threads), args[-1]]
+    cmd = prefix + args
+    tail = deque(maxlen=MEDIA_STDERR_LINES)
+    state = {"last": time.time(), "frame": -1, "out_time": -1.0, "reported": 0.0}
+
+    t0 = time.time()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, errors="replace")
+    if workspace is not None and workspace.background and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, proc.pid, BACKGROUND_NICE)
+        except OSError:
+            pass
+
+    def read_progress():
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            if key in ("frame", "out_time_us", "out_time_ms"):
+                try:
+                    # out_time_ms ham aslida mikrosoniya
+                    number = int(value) / 1e6 if key != "frame" else int(value)
+                except ValueError:
+                    continue
+                field = "frame" if key == "frame" else "out_time"
+                if number > state[field]:
+                    state[field] = number
+                    state["last"] = time.time()
+            elif key == "progress" and duration and on_progress:
+                now = time.time()
+                if value == "end" or now - state["reported"] >= 1:
+                    state["reported"] = now
+                    on_progress(1.0 if value == "end" else min(1.0, max(0.0, state["out_time"]) / duration))
+
+    def read_stderr():
+        for line in proc.stderr:
+            tail.append(line.rstrip())
+
+    readers = [threading.Thread(target=read_progress, daemon=True),
+               threading.Thread(target=read_stderr, daemon=True)]
+    for t in readers:
+        t.start()
+
+    try:
+        while True:
+            try:
+                proc.wait(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if cancelled.is_set():
+                raise MediaCancelled("Bekor qilindi")
+            if time.time() - state["last"] > stall_timeout:
+                metrics.inc("pubg_ffmpeg_failures_total", op=op)
+                raise MediaError(f"ffmpeg {stall_timeout:.0f}s davomida oldinga siljimadi",
+                                 tail="\n".join(tail))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        for t in readers:
+            t.join(timeout=2)
+
+    metrics.observe("pubg_ffmpeg_duration_seconds", time.time() - t0, op=op)
+    if proc.returncode != 0:
+        metrics.inc("pubg_ffmpeg_failures_total", op=op)
+        raise MediaError(f"ffmpeg xato kodi {proc.returncode}", proc.returncode, "\n".join(tail))
+    return {"frames": max(0, state["frame"]), "out_time": max(0.0, state["out_time"])}
+
+
+# ============================================
+# ENCODER PROFILI (x264)
+# ============================================
+
+ENCODER_PROFILE_PATH = DATA_DIR / "encoder_profile.json"
+DEFAULT_ENCODER_PROFILE = {"preset": "ultrafast", "crf": 23, "threads": None}
+
+
+def load_encoder_profile(path=ENCODER_PROFILE_PATH):
+    """`python app.py bench-encoder` tanlagan profil; fayl bo'lmasa eski ultrafast/23"""
+    profile = dict(DEFAULT_ENCODER_PROFILE)
+    try:
+        saved = json.loads(Path(path).read_text(encoding='utf-8'))
+        profile.update({k: saved[k] for k in DEFAULT_ENCODER_PROFILE if k in saved})
+    except (OSError, ValueError):
+        pass
+    return profile
+
+
+encoder_profile = load_encoder_profile()
+
+
+def encoder_args(profile=None):
+    """Barcha libx264 encode joylari uchun umumiy argumentlar"""
+    profile = profile or encoder_profile
+    return ['-c:v', 'libx264', '-preset', profile["preset"], '-crf', str(profile["crf"])]
+
+
+# ============================================
+# RESURS REJALASHTIRUVCHISI (CPU / XOTIRA)
+# ============================================
+
+def detect_cpu_count():
+    """Jarayonga ruxsat berilgan yadrolar (affinity va cgroup cpu.max kvotasi hisobga olinadi)"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            count = min(count, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, count)
+
+
+def detect_memory_bytes():
+    """Fizik xotira yoki cgroup memory.max chegarasi (qaysi biri kichik bo'lsa)"""
+    total = None
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        pass
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            total = min(total or int(limit), int(limit))
+    except (OSError, ValueError):
+        pass
+    return total
+
+
+class ResourceScheduler:
+    """
+    Encode'lar uchun qabul nazorati
+    - Slotlar: yadrolar / 2 (profilda threads bo'lsa yadrolar / threads) va
+      xotira / ENCODE_MEMORY_MB dan kichigi (yoki ENCODE_SLOTS), RENDER_WORKERS dan oshmaydi
+    - Thread'lar: profildagi threads (bench-encoder shuni o'lchagan), bo'lmasa
+      yadrolar slotlar orasida bo'linadi (-threads, -filter_threads)
+    - Fon ishi (warm pool) slot ulushini olmaydi: alohida bitta o'rinda, faqat kutayotgan
+      va slotlarni to'ldirgan asosiy ish bo'lmasa kiradi, nice bilan ishlaydi
+    """
+
+    def __init__(self, slots=0, memory_per_encode_mb=ENCODE_MEMORY_MB):
+        self.cores = detect_cpu_count()
+        self.memory = detect_memory_bytes()
+        self.slots, self.threads = self.plan(self.cores, self.memory, encoder_profile["threads"],
+                                             slots, memory_per_encode_mb)
+        self._cond = threading.Condition()
+        self._active = {}
+        self._waiting = 0
+        self.admitted = 0
+        self.wait_seconds = 0.0
+
+    @staticmethod
+    def plan(cores, memory, profile_threads=None, slots=0, memory_per_encode_mb=ENCODE_MEMORY_MB):
+        """(slotlar, encode uchun thread'lar) - scheduler ham, bench-encoder ham shuni ishlatadi"""
+        if not slots:
+            slots = cores // (profile_threads or 2)
+            if memory:
+                slots = min(slots, memory // (memory_per_encode_mb * 1024 * 1024))
+        slots = max(1, min(slots, RENDER_WORKERS))
+        threads = min(profile_threads, cores) if profile_threads else cores // slots
+        return slots, max(1, threads)
+
+    def _foreground(self):
+        return sum(1 for _, bg in self._active.values() if not bg)
+
+    def busy(self):
+        with self._cond:
+            return self._foreground() >= self.slots
+
+    def _blocked(self, background):
+        if not background:
+            return self._foreground() >= self.slots
+        # Fon ishi: bittadan, asosiy ishlar kutmayotgan va slotlar to'lmagan paytda
+        return (any(bg for _, bg in self._active.values()) or self._waiting
+                or self._foreground() >= self.slots)
+
+    @contextmanager
+    def admit(self, workspace, background=False):
+        """Slot bo'shashini kutish (bekor qilinsa MediaCancelled), ichida workspace.threads o'rnatiladi"""
+        t0 = time.time()
+        token = object()
+        with self._cond:
+            if not background:
+                self._waiting += 1
+            try:
+                while self._blocked(background):
+                    if workspace.cancelled.is_set():
+                        raise MediaCancelled("Bekor qilindi")
+                    self._cond.wait(timeout=1)
+            finally:
+                if not background:
+                    self._waiting -= 1
+            self._active[token] = (workspace.name, background)
+            self.admitted += 1
+            self.wait_seconds += time.time() - t0
+
+        workspace.threads = self.threads
+        workspace.background = background
+        try:
+            yield self.threads
+        finally:
+            workspace.threads = None
+            with self._cond:
+                del self._active[token]
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "cores": self.cores,
+                "memory_bytes": self.memory,
+                "slots": self.slots,
+                "threads_per_encode": self.threads,
+                "active": [{"workspace": name, "background": bg} for name, bg in self._active.values()],
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "wait_seconds": round(self.wait_seconds, 1),
+            }
+
+
+resource_scheduler = ResourceScheduler(ENCODE_SLOTS)
+
+
 # ============================================
 # FLASK APP
 # ============================================
@@ -148,7 +720,193 @@ app = Flask(__name__, template_folder=str(TEMPLATES_DIR))
 app.secret_key = os.urandom(24).hex()
 CORS(app)
 
-bot_status = {
+
+# ============================================
+# HOLAT OMBORI (STATE STORE)
+# ============================================
+
+class StateTransaction:
+    """StateStore ichidagi bitta atomik o'zgarish (faqat store.transaction() orqali)"""
+
+    def __init__(self, state):
+        self._state = state
+        self.fields = {}
+        self.jobs = {}  # job_id -> yangi holat yoki None (o'chirilgan)
+        self.logs = []
+
+    def get(self, key, default=None):
+        if key in self.fields:
+            return self.fields[key]
+        return self._state.get(key, default)
+
+    def set(self, **fields):
+        for key, value in fields.items():
+            if self.get(key) != value:
+                self.fields[key] = value
+
+    def incr(self, key, n=1):
+        self.fields[key] = self.get(key, 0) + n
+
+    def job(self, job_id):
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        return self._state["jobs"].get(job_id)
+
+    def all_jobs(self):
+        merged = dict(self._state["jobs"])
+        for job_id, job in self.jobs.items():
+            if job is None:
+                merged.pop(job_id, None)
+            else:
+                merged[job_id] = job
+        return merged
+
+    def add_job(self, job_id, job):
+        self.jobs[job_id] = dict(job)
+
+    def update_job(self, job_id, **fields):
+        job = self.job(job_id)
+        if job is not None:
+            self.jobs[job_id] = {**job, **fields}
+
+    def remove_job(self, job_id):
+        self.jobs[job_id] = None
+
+    def log(self, line):
+        self.logs.append(line)
+
+
+class StateStore:
+    """
+    Bot holati uchun thread-safe, versiyalangan ombor
+    - Yozish: transaction() ichida atomik, har o'zgarish yangi seq oladi
+    - O'qish: nashr qilingan holat hech qachon o'zgartirilmaydi (copy-on-write),
+      o'quvchilar qulf kutmaydi
+    - Log: sobit hajmli halqa bufer (seq bilan), ro'yxat siljitilmaydi
+    - Jurnal: delta (?since=) uchun halqa bufer
+    - Har bir ish (job) alohida sub-holat
+    """
+
+    def __init__(self, initial, log_size=50, journal_size=1000):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(threading.Lock())
+        self._log_size = log_size
+        self._journal_size = journal_size
+        self._logs = [None] * log_size          # (log_no, seq, qator)
+        self._journal = [None] * journal_size   # (seq, kalit, qiymat)
+        state = dict(initial)
+        state["jobs"] = dict(state.get("jobs", {}))
+        # (seq, holat, log_soni) - bitta atribut, o'quvchi uchun atomik
+        self._current = (0, state, 0)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            seq, state, log_count = self._current
+            tx = StateTransaction(state)
+            yield tx
+
+            if not (tx.fields or tx.jobs or tx.logs):
+                return
+            new_state = dict(state)
+            new_state.update(tx.fields)
+            if tx.jobs:
+                jobs = dict(state["jobs"])
+                for job_id, job in tx.jobs.items():
+                    if job is None:
+                        jobs.pop(job_id, None)
+                    else:
+                        jobs[job_id] = job
+                new_state["jobs"] = jobs
+
+            entries = [(key, None) for key in tx.fields] + [(f"jobs:{j}", None) for j in tx.jobs]
+            entries += [("log", line) for line in tx.logs]
+            for key, value in entries:
+                seq += 1
+                self._journal[seq % self._journal_size] = (seq, key, value)
+                if key == "log":
+                    self._logs[log_count % self._log_size] = (log_count, seq, value)
+                    log_count += 1
+            self._current = (seq, new_state, log_count)
+
+        with self._changed:
+            self._changed.notify_all()
+
+    def set(self, **fields):
+        """Oddiy maydonlarni yangilash (faqat haqiqatan o'zgarganlari versiyalanadi)"""
+        with self.transaction() as tx:
+            tx.set(**fields)
+
+    def update_job(self, job_id, **fields):
+        with self.transaction() as tx:
+            tx.update_job(job_id, **fields)
+
+    @property
+    def seq(self):
+        return self._current[0]
+
+    def get(self, key, default=None):
+        return self._current[1].get(key, default)
+
+    def job(self, job_id):
+        return self._current[1]["jobs"].get(job_id)
+
+    def jobs(self):
+        return self._current[1]["jobs"]
+
+    def _logs_until(self, log_count, since=None):
+        """Eng yangisi birinchi; since berilsa faqat undan keyingi seq'lar"""
+        lines = []
+        for log_no in range(log_count - 1, max(-1, log_count - self._log_size - 1), -1):
+            entry = self._logs[log_no % self._log_size]
+            if entry is None or entry[0] != log_no:
+                break  # yozuvchi bu joyni allaqachon qayta yozgan
+            if since is not None and entry[1] <= since:
+                break
+            lines.append(entry[2])
+        return lines
+
+    def snapshot(self):
+        """Izchil holat nusxasi (JSON uchun tayyor)"""
+        seq, state, log_count = self._current
+        snapshot = dict(state)
+        snapshot["jobs"] = dict(state["jobs"])
+        snapshot["logs"] = self._logs_until(log_count)
+        snapshot["seq"] = seq
+        return snapshot
+
+    def delta(self, since):
+        """
+        since dan keyingi o'zgarishlar
+        - Jurnal yetmasa (juda eski since) - to'liq holat (full=True)
+        - jobs: o'zgargan ishlar, o'chirilgan ish - null
+        - logs: yangi qatorlar (eng yangisi birinchi)
+        """
+        seq, state, log_count = self._current
+        if since > seq or since < seq - self._journal_size:
+            return {"seq": seq, "full": True, "state": self.snapshot()}
+
+        changes, jobs, logs = {}, {}, []
+        for n in range(since + 1, seq + 1):
+            entry = self._journal[n % self._journal_size]
+            if entry is None or entry[0] != n:
+                return {"seq": seq, "full": True, "state": self.snapshot()}
+            _, key, value = entry
+            if key == "log":
+                logs.append(value)
+            elif key.startswith("jobs:"):
+                jobs[key[5:]] = state["jobs"].get(key[5:])
+            else:
+                changes[key] = state.get(key)
+        return {"seq": seq, "full": False, "changes": changes, "jobs": jobs, "logs": logs[::-1]}
+
+    def wait_for_change(self, seq, timeout):
+        """seq dan yangi versiya paydo bo'lguncha kutish (SSE uchun)"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.seq > seq, timeout=timeout)
+
+
+bot_status = StateStore({
     "status": "idle",
     "message": "Bot ishga tayyor ✅",
     "mode": "auto",
@@ -156,15 +914,16 @@ bot_status = {
     "last_video_url": None,
     "last_run": None,
     "next_run": "09:00",
-    "logs": [],
-    "progress": 0,
     "current_topic": "",
     "queue_size": 0,
+    "upload_queue_size": 0,
     "topics_generated": 0,
-    "errors": []
-}
+    "errors": [],
+    "jobs": {}
+})
 
 video_queue = Queue()
+upload_queue = Queue()  # Render tugagan ishlar - yuklash worker'lariga
 
 # ============================================
 # 1. MAVZU YARATISH (AI)
@@ -197,30 +956,227 @@ CONTENT_TYPES = [
     "extended mag", "vertical grip", "thumb grip benefits"
 ]
 
-used_topics = []
-used_topics_max = 100
+TOPIC_FILLER_WORDS = {"the", "and", "for", "in", "to", "of", "a", "an", "how", "your", "you", "with", "on", "like"}
+
+
+class TopicIndex:
+    """
+    Restartdan keyin ham saqlanadigan mavzular indeksi (near-duplicate aniqlash)
+    - Har mavzu: so'zlar to'plami + MinHash imzo (64 ta permutatsiya)
+    - Qidiruv: NumPy bilan barcha imzolar bir vaqtda taqqoslanadi,
+      chegaradan o'tganlar aniq Jaccard bilan tekshiriladi
+    - Fayl: data/topics.jsonl (append), yuklanganda eskilari tashlanadi
+    """
+
+    PRIME = 4294967311  # 2^32 dan katta tub son
+
+    def __init__(self, path, threshold, retention_days, max_entries, num_perm=64):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.retention = retention_days * 86400
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        rng = random.Random(1234)  # Imzolar restartlar orasida bir xil bo'lishi uchun
+        self._perm_a = [rng.randrange(1, 2 ** 32) for _ in range(num_perm)]
+        self._perm_b = [rng.randrange(0, 2 ** 32) for _ in range(num_perm)]
+        if NUMPY_AVAILABLE:
+            self._np_a = np.array(self._perm_a, dtype=np.uint64)
+            self._np_b = np.array(self._perm_b, dtype=np.uint64)
+        self._topics = []     # [(mavzu, vaqt)]
+        self._tokens = []     # [frozenset]
+        self._signatures = []
+        self._matrix = None   # NumPy imzolar matritsasi (keshlangan)
+        self._load()
+
+    @staticmethod
+    def tokens(topic):
+        words = re.findall(r"[a-z0-9]+", topic.lower())
+        return frozenset(w for w in words if w not in TOPIC_FILLER_WORDS)
+
+    def _signature(self, tokens):
+        if not tokens:
+            return None
+        hashes = [zlib.crc32(t.encode('utf-8')) for t in tokens]
+        if NUMPY_AVAILABLE:
+            h = np.array(hashes, dtype=np.uint64)[:, None]
+            return ((h * self._np_a + self._np_b) % self.PRIME).min(axis=0)
+        return [min((a * h + b) % self.PRIME for h in hashes)
+                for a, b in zip(self._perm_a, self._perm_b)]
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        cutoff = time.time() - self.retention
+        entries = []
+        for line in self.path.read_text(encoding='utf-8').splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if item.get("ts", 0) >= cutoff:
+                entries.append((item["topic"], item["ts"]))
+        for topic, ts in entries[-self.max_entries:]:
+            self._append(topic, ts)
+        self._compact()
+
+    def _compact(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for topic, ts in self._topics:
+                f.write(json.dumps({"topic": topic, "ts": ts}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def _append(self, topic, ts):
+        tokens = self.tokens(topic)
+        self._topics.append((topic, ts))
+        self._tokens.append(tokens)
+        self._signatures.append(self._signature(tokens))
+        self._matrix = None
+
+    def _find(self, tokens, signature):
+        if signature is None or not self._topics:
+            return None
+
+        # 1) MinHash baholash - nomzodlar
+        margin = 0.15
+        if NUMPY_AVAILABLE:
+            if self._matrix is None:
+                empty = np.full(len(self._perm_a), np.iinfo(np.uint64).max, dtype=np.uint64)
+                self._matrix = np.vstack([sig if sig is not None else empty for sig in self._signatures])
+            estimates = (self._matrix == signature).mean(axis=1)
+            candidates = np.nonzero(estimates >= self.threshold - margin)[0]
+        else:
+            n = len(signature)
+            candidates = [i for i, sig in enumerate(self._signatures)
+                          if sig is not None and sum(x == y for x, y in zip(sig, signature)) / n >= self.threshold - margin]
+
+        # 2) Aniq Jaccard bilan tasdiqlash
+        best = None
+        for i in candidates:
+            other = self._tokens[i]
+            score = len(tokens & other) / len(tokens | other)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (self._topics[i][0], score)
+        return best
+
+    def find_similar(self, topic):
+        """O'xshash eski mavzu: (mavzu, o'xshashlik) yoki None"""
+        tokens = self.tokens(topic)
+        with self._lock:
+            return self._find(tokens, self._signature(tokens))
+
+    def add(self, topic):
+        """Yangi bo'lsa qo'shadi (True); o'xshashi bor bo'lsa False"""
+        tokens = self.tokens(topic)
+        signature = self._signature(tokens)
+        with self._lock:
+            similar = self._find(tokens, signature)
+            if similar:
+                logger.info(f"♻️ Mavzu takrorga o'xshaydi ({similar[1]:.2f}): {topic} ~ {similar[0]}")
+                return False
+
+            ts = time.time()
+            self._append(topic, ts)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"topic": topic, "ts": ts}, ensure_ascii=False) + "\n")
+
+            # Muddati o'tgan / ortiqcha yozuvlar
+            cutoff = ts - self.retention
+            if len(self._topics) > self.max_entries or self._topics[0][1] < cutoff:
+                keep = [(t, s) for t, s in self._topics if s >= cutoff][-self.max_entries:]
+                self._topics, self._tokens, self._signatures, self._matrix = [], [], [], None
+                for t, s in keep:
+                    self._append(t, s)
+                self._compact()
+            return True
+
+    def recent(self, n=10):
+        with self._lock:
+            return [t for t, _ in self._topics[-n:]]
+
+    def __len__(self):
+        return len(self._topics)
+
+
+topic_index = TopicIndex(
+    DATA_DIR / "topics.jsonl",
+    threshold=TOPIC_SIMILARITY,
+    retention_days=TOPIC_RETENTION_DAYS,
+    max_entries=TOPIC_INDEX_MAX,
+)
+
+groq_client = None
+groq_client_lock = threading.Lock()
+
+
+def get_groq_client():
+    """
+    Jarayon bo'yicha yagona Groq client
+    - Bitta httpx.Client: keep-alive ulanishlar qayta ishlatiladi (TLS handshake har safar emas)
+    - Aniq timeout'lar, thread-safe
+    """
+    global groq_client
+    if not (GROQ_AVAILABLE and GROQ_API_KEY):
+        return None
+
+    with groq_client_lock:
+        if groq_client is None:
+            timeout = httpx.Timeout(GROQ_TIMEOUT_SECONDS, connect=5.0)
+            http_client = httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=120),
+            )
+            groq_client = Groq(
+                api_key=GROQ_API_KEY,
+                timeout=timeout,
+                max_retries=1,
+                http_client=http_client,
+            )
+        return groq_client
+
+
+def register_topic(topic):
+    """Mavzu yangi bo'lsa ro'yxatga olish (True), takror yoki juda o'xshash bo'lsa False"""
+    if not topic_index.add(topic):
+        return False
+    with bot_status.transaction() as tx:
+        tx.incr("topics_generated")
+    return True
+
+
+def avoid_topics_hint():
+    """Groq takror mavzu bermasligi uchun oxirgi mavzular ro'yxati"""
+    recent = topic_index.recent(10)
+    if not recent:
+        return ""
+    return " Do NOT repeat or paraphrase these recent topics: " + "; ".join(recent) + "."
+
+
+def template_topic():
+    template = random.choice(TOPIC_TEMPLATES)
+    content = random.choice(CONTENT_TYPES)
+    extras = ["", " in 2026", " pro tips", " complete guide", " for beginners", " advanced"]
+    return template.format(content) + random.choice(extras)
 
 
 def generate_unique_topic(max_retries=5):
     """UNIQUE mavzu yaratish"""
-    global used_topics
-
     for attempt in range(max_retries):
         topic = None
 
-        if GROQ_AVAILABLE and GROQ_API_KEY:
+        client = get_groq_client()
+        if client:
             try:
-                client = Groq(api_key=GROQ_API_KEY)
                 prompts = [
                     "Generate ONE unique PUBG Mobile tips video topic. Return ONLY the topic, nothing else. Be creative and specific.",
                     "Create ONE original PUBG gameplay tutorial topic. Return ONLY topic name. Make it interesting.",
                     "Invent ONE catchy PUBG tips title. Return ONLY title, no explanation. Focus on specific weapons or maps.",
                 ]
                 completion = client.chat.completions.create(
-                    model="mixtral-8x7b-32768",
+                    model=GROQ_MODEL,
                     messages=[
                         {"role": "system", "content": "You are a PUBG expert. Generate unique, specific video topics."},
-                        {"role": "user", "content": random.choice(prompts)}
+                        {"role": "user", "content": random.choice(prompts) + avoid_topics_hint()}
                     ],
                     temperature=1.0,
                     max_tokens=50
@@ -233,37 +1189,137 @@ def generate_unique_topic(max_retries=5):
                 logger.warning(f"Groq xato (urinish {attempt + 1}): {e}")
                 topic = None
 
-        if not topic:
-            template = random.choice(TOPIC_TEMPLATES)
-            content = random.choice(CONTENT_TYPES)
-            extras = ["", " in 2026", " pro tips", " complete guide", " for beginners", " advanced"]
-            topic = template.format(content) + random.choice(extras)
-
-        if topic not in used_topics:
-            used_topics.append(topic)
-            if len(used_topics) > used_topics_max:
-                used_topics.pop(0)
-            bot_status["topics_generated"] += 1
+        from_template = not topic
+        if from_template:
+            topic = template_topic()
+
+        if register_topic(topic):
+            if from_template:
+                metrics.inc("pubg_fallback_total", kind="template_topic")
             logger.info(f"🎯 AI yaratgan mavzu: {topic}")
             return topic
 
+    metrics.inc("pubg_fallback_total", kind="template_topic")
     return f"PUBG Mobile Pro Tips #{random.randint(100, 999)}"
 
 
+def generate_topic_and_script(max_retries=3):
+    """
+    Mavzu va scriptni bitta JSON so'rovda olish (2 ta o'rniga 1 ta LLM chaqiruv)
+    - Javob tekshiriladi; mos kelmasa yoki takror bo'lsa qayta so'raladi
+    - Groq ishlamasa (topic, script) o'rniga None - chaqiruvchi eski yo'lga o'tadi
+    """
+    client = get_groq_client()
+    if not client:
+        return None
+
+    for attempt in range(max_retries):
+        style = random.choice(SCRIPT_STYLES)
+        try:
+            completion = client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=[
+                    {"role": "system",
+                     "content": "You are a professional PUBG Mobile YouTuber. "
+                                'Reply ONLY with JSON: {"topic": "...", "script": "..."}'},
+                    {"role": "user",
+                     "content": f"Invent ONE unique, specific PUBG Mobile tips video topic (weapons, maps or tactics). "
+                                f"Then write a {style} 15-second script about it with a call to action. "
+                                f"Maximum 30 words." + avoid_topics_hint()}
+                ],
+                temperature=1.0,
+                max_tokens=200,
+                response_format={"type": "json_object"}
+            )
+            data = json.loads(completion.choices[0].message.content)
+            topic = str(data.get("topic", "")).strip().strip('"').strip("'").strip()
+            script = str(data.get("script", "")).strip()
+        except Exception as e:
+            logger.warning(f"Groq JSON xato (urinish {attempt + 1}): {e}")
+            continue
+
+        if not 8 <= len(topic) <= 100 or len(script) <= 20:
+            logger.warning(f"Groq JSON yaroqsiz (urinish {attempt + 1})")
+            continue
+
+        if register_topic(topic):
+            logger.info(f"🎯 AI mavzu + script (1 so'rov): {topic}")
+            return topic, script
+
+    return None
+
+
+def generate_topic_candidates(n):
+    """Bitta LLM so'rovda n ta mavzu nomzodi (JSON ro'yxat)"""
+    client = get_groq_client()
+    if not client:
+        return []
+    try:
+        completion = client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[
+                {"role": "system",
+                 "content": "You are a PUBG expert. Generate unique, specific video topics. "
+                            'Reply ONLY with JSON: {"topics": ["...", "..."]}'},
+                {"role": "user",
+                 "content": f"Generate {n} different PUBG Mobile tips video topics about specific "
+                            f"weapons, maps or tactics." + avoid_topics_hint()}
+            ],
+            temperature=1.0,
+            max_tokens=min(40 * n + 50, 2000),
+            response_format={"type": "json_object"}
+        )
+        topics = json.loads(completion.choices[0].message.content).get("topics", [])
+    except Exception as e:
+        logger.warning(f"Groq batch xato: {e}")
+        return []
+    cleaned = (str(t).strip().strip('"').strip("'").strip() for t in topics if t)
+    return [t for t in cleaned if 8 <= len(t) <= 100]
+
+
+def generate_topic_batch(n):
+    """
+    n ta unique mavzu - tayyor bo'lishi bilan yield qilinadi
+    - Avval bitta LLM so'rovda ko'p nomzod, lokal near-duplicate filtri
+    - Yetmaganlari parallel generate_unique_topic (TOPIC_CONCURRENCY cheklovi)
+    """
+    produced = 0
+    for topic in generate_topic_candidates(n):
+        if produced >= n:
+            break
+        if register_topic(topic):
+            produced += 1
+            yield topic
+
+    remaining = n - produced
+    if remaining <= 0:
+        return
+    with ThreadPoolExecutor(max_workers=min(TOPIC_CONCURRENCY, remaining),
+                            thread_name_prefix="topics") as pool:
+        futures = [pool.submit(generate_unique_topic) for _ in range(remaining)]
+        for fut in as_completed(futures):
+            try:
+                yield fut.result()
+            except Exception as e:
+                logger.warning(f"Mavzu yaratish xatosi: {e}")
+
+
 # ============================================
 # 2. SCRIPT YARATISH (AI)
 # ============================================
 
+SCRIPT_STYLES = ["energetic", "professional", "funny", "dramatic", "casual", "exciting"]
+
+
 def generate_unique_script(topic):
     """Mavzuga mos script yaratish"""
-    if GROQ_AVAILABLE and GROQ_API_KEY:
+    client = get_groq_client()
+    if client:
         try:
-            client = Groq(api_key=GROQ_API_KEY)
-            styles = ["energetic", "professional", "funny", "dramatic", "casual", "exciting"]
-            style = random.choice(styles)
+            style = random.choice(SCRIPT_STYLES)
 
             completion = client.chat.completions.create(
-                model="mixtral-8x7b-32768",
+                model=GROQ_MODEL,
                 messages=[
                     {"role": "system",
                      "content": f"You are a professional PUBG YouTuber. Write a {style} 15-second video script about the topic. Make it engaging and call to action. Maximum 30 words."},
@@ -287,6 +1343,7 @@ def generate_unique_script(topic):
         f"Today I'll show you {topic}. This technique works 100% of the time!",
         f"Never seen before {topic} strategy! You won't believe how easy it is!",
     ]
+    metrics.inc("pubg_fallback_total", kind="template_script")
     return random.choice(templates)
 
 
@@ -294,12 +1351,286 @@ def generate_unique_script(topic):
 # 3. REAL VIDEO YUKLASH (PUBG Mobile gameplay)
 # ============================================
 
-def download_pubg_video(topic):
+def find_downloaded_file(uid, min_size=500000, folder=OUTPUT_DIR):
+    """yt-dlp yuklagan faylni topish"""
+    for ext in ['mp4', 'webm', 'mkv']:
+        candidate = Path(folder) / f"pubg_{uid}.{ext}"
+        if candidate.exists() and candidate.stat().st_size > min_size:
+            return candidate
+    return None
+
+
+def download_video_section(url, ydl_opts, start, end):
+    """
+    Videoning faqat [start, end] oralig'ini yuklash
+    - yt-dlp download_ranges (ichida ffmpeg to'g'ridan-to'g'ri URL'dan o'qiydi)
+    - To'liq fayl diskka yozilmaydi
+    """
+    section_opts = dict(ydl_opts)
+    section_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [(start, end)])
+    section_opts['force_keyframes_at_cuts'] = False
+
+    with yt_dlp.YoutubeDL(section_opts) as sdl:
+        sdl.download([url])
+
+
+TOPIC_STOPWORDS = {
+    "pubg", "mobile", "the", "and", "for", "how", "with", "your", "you", "like",
+    "pro", "tips", "best", "guide", "top", "in", "to", "of", "a", "2026",
+}
+
+
+class ClipLibrary:
+    """
+    Lokal PUBG gameplay kliplar kutubxonasi
+    - Fayllar: data/clips, indeks: data/library.db (SQLite)
+    - Mavzu so'zlari bo'yicha tanlash, eng kam ishlatilgani birinchi
+    - Disk kvotasi va foydalanish chegarasi bo'yicha tozalash
+    """
+
+    def __init__(self, clips_dir, db_path, quota_bytes, min_pool, max_uses):
+        self.clips_dir = Path(clips_dir)
+        self.quota_bytes = quota_bytes
+        self.min_pool = min_pool
+        self.max_uses = max_uses
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS clips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_id TEXT,
+                title TEXT,
+                path TEXT UNIQUE,
+                duration REAL,
+                width INTEGER,
+                height INTEGER,
+                vcodec TEXT,
+                size INTEGER,
+                section_start REAL,
+                downloaded_at TEXT,
+                last_used TEXT,
+                times_used INTEGER DEFAULT 0
+            )
+        """)
+        self._db.commit()
+        self._prune_missing()
+
+    def _prune_missing(self):
+        with self._lock:
+            rows = self._db.execute("SELECT id, path FROM clips").fetchall()
+            gone = [(r["id"],) for r in rows if not Path(r["path"]).exists()]
+            self._db.executemany("DELETE FROM clips WHERE id = ?", gone)
+            self._db.commit()
+
+    @staticmethod
+    def keywords(text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        return {w for w in words if len(w) > 2 and w not in TOPIC_STOPWORDS}
+
+    def _usable(self, min_duration):
+        return self._db.execute(
+            "SELECT * FROM clips WHERE duration >= ? AND times_used < ?",
+            (min_duration, self.max_uses)
+        ).fetchall()
+
+    def pick(self, topic, min_duration=0):
+        """Mavzuga mos klip yo'li; kutubxona yupqa bo'lsa None (tarmoqdan yuklash kerak)"""
+        with self._lock:
+            rows = self._usable(min_duration)
+            if not rows or len(rows) < self.min_pool:
+                return None
+
+            topic_words = self.keywords(topic)
+            scored = [(len(topic_words & self.keywords(r["title"] or "")), r) for r in rows]
+            best_score = max(score for score, _ in scored)
+            pool = [r for score, r in scored if score == best_score]
+            # Eng kam ishlatilgan, keyin eng uzoq vaqt ishlatilmagan
+            row = min(pool, key=lambda r: (r["times_used"], r["last_used"] or ""))
+
+            self._db.execute(
+                "UPDATE clips SET times_used = times_used + 1, last_used = ? WHERE id = ?",
+                (datetime.now().isoformat(timespec="seconds"), row["id"])
+            )
+            self._db.commit()
+            return row["path"]
+
+    def add(self, info, file_path, section_start=None):
+        """Yuklangan faylni kutubxonaga ko'chirib indekslash, yangi yo'lni qaytaradi"""
+        src = Path(file_path)
+        dest = self.clips_dir / f"{info.get('id') or 'clip'}_{uuid.uuid4().hex[:8]}{src.suffix}"
+        try:
+            duration = get_media_duration(src)
+        except Exception:
+            duration = info.get('duration') or 0
+
+        shutil.move(str(src), str(dest))
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO clips (video_id, title, path, duration, width, height, vcodec, size, "
+                "section_start, downloaded_at, last_used, times_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)",
+                (info.get('id'), info.get('title'), str(dest), duration, info.get('width'),
+                 info.get('height'), info.get('vcodec'), dest.stat().st_size, section_start,
+                 datetime.now().isoformat(timespec="seconds"), datetime.now().isoformat(timespec="seconds"))
+            )
+            self._db.commit()
+            self._evict(keep=str(dest))
+        return str(dest)
+
+    def _evict(self, keep=None):
+        """
+        Kvotadan oshsa yoki klip eskirsa (max_uses) - eng eski ishlatilganlari o'chiriladi
+        - Oxirgi soatda olingan kliplarga tegilmaydi (render hali o'qiyotgan bo'lishi mumkin),
+          shu sababli kutubxona vaqtincha kvotadan oshib turishi mumkin
+        """
+        rows = self._db.execute(
+            "SELECT id, path, size, times_used, last_used FROM clips "
+            "ORDER BY times_used >= ? DESC, COALESCE(last_used, downloaded_at) ASC",
+            (self.max_uses,)
+        ).fetchall()
+        total = sum(r["size"] or 0 for r in rows)
+        # Yaqinda olingan klip hali render qilinayotgan bo'lishi mumkin
+        recent = (datetime.now() - timedelta(hours=1)).isoformat(timespec="seconds")
+        for r in rows:
+            if r["path"] == keep or (r["last_used"] or "") >= recent:
+                continue
+            exhausted = r["times_used"] >= self.max_uses
+            if total <= self.quota_bytes and not exhausted:
+                continue
+            try:
+                Path(r["path"]).unlink()
+            except OSError:
+                pass
+            self._db.execute("DELETE FROM clips WHERE id = ?", (r["id"],))
+            total -= r["size"] or 0
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS bytes, "
+                "SUM(times_used < ?) AS usable FROM clips",
+                (self.max_uses,)
+            ).fetchone()
+            return {"clips": row["n"], "usable": row["usable"] or 0, "bytes": row["bytes"],
+                    "quota_bytes": self.quota_bytes}
+
+
+def add_to_library(info, file_path, section_start=None):
+    """Kutubxonaga qo'shish; xato bo'lsa asl fayl ishlatiladi"""
+    try:
+        return clip_library.add(info, file_path, section_start=section_start)
+    except Exception as e:
+        logger.warning(f"Klip kutubxonaga qo'shilmadi: {e}")
+        return str(file_path)
+
+
+clip_library = ClipLibrary(
+    LIBRARY_DIR, DATA_DIR / "library.db",
+    quota_bytes=int(LIBRARY_QUOTA_MB * 1024 * 1024),
+    min_pool=LIBRARY_MIN_POOL,
+    max_uses=LIBRARY_MAX_USES,
+)
+
+
+class SearchCache:
+    """
+    yt-dlp qidiruv natijalari uchun TTL kesh
+    - Kalit: qidiruv so'rovi
+    - Qiymat: filtrdan o'tgan nomzodlar (20-300s, sarlavhada "pubg")
+    """
+
+    def __init__(self, ttl, max_entries=100):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}  # so'rov -> (vaqt, nomzodlar)
+
+    def get(self, query):
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry and time.time() - entry[0] < self.ttl:
+                self.hits += 1
+                return list(entry[1])
+            self._entries.pop(query, None)
+            self.misses += 1
+            return None
+
+    def put(self, query, candidates):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda q: self._entries[q][0])
+                del self._entries[oldest]
+            self._entries[query] = (time.time(), list(candidates))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "ttl": self.ttl}
+
+
+search_cache = SearchCache(SEARCH_CACHE_TTL)
+
+CANDIDATE_FIELDS = ('id', 'title', 'duration', 'webpage_url', 'width', 'height', 'vcodec')
+
+
+def search_pubg_candidates(ydl, search):
+    """ytsearch20 + filtr; natija keshlanadi"""
+    candidates = search_cache.get(search)
+    if candidates is not None:
+        logger.info(f"♻️ Qidiruv keshdan: {search} ({len(candidates)} ta)")
+        return candidates
+
+    # Ko'proq video qidirish
+    with metrics.timer("pubg_step_duration_seconds", step="search"):
+        info = ydl.extract_info(f"ytsearch20:{search}", download=False)
+
+    if not info or 'entries' not in info:
+        return []
+
+    # Filtr: 20-300 soniya, PUBG Mobile bilan bog'liq
+    candidates = []
+    for v in info['entries']:
+        if not v or not isinstance(v, dict):
+            continue
+
+        dur = v.get('duration') or 0
+        title = v.get('title', '').lower()
+
+        # Filtr shartlari
+        if 20 < dur < 300:
+            if 'pubg mobile' in title or 'pubg' in title:
+                # Keshda faqat kerakli maydonlar saqlanadi
+                candidates.append({k: v.get(k) for k in CANDIDATE_FIELDS})
+
+    search_cache.put(search, candidates)
+    return candidates
+
+
+def download_pubg_video(topic, clip_duration=None, start_offset=None, workspace=None):
     """
     REAL PUBG Mobile video yuklash
+    - clip_duration berilsa faqat kerakli bo'lak yuklanadi (section download)
+    - start_offset: bo'lak boshi (soniya), berilmasa tasodifiy
+    - Bo'lak yuklanmasa to'liq fayl yuklanadi (fallback)
+    - Avval lokal kutubxonadan, u yupqa bo'lsagina tarmoqdan
     """
-    uid = f"{int(time.time())}_{random.randint(100, 999)}"
-    output_template = str(OUTPUT_DIR / f"pubg_{uid}.%(ext)s")
+    try:
+        library_clip = clip_library.pick(topic, min_duration=clip_duration or 0)
+    except Exception as e:
+        logger.warning(f"Kutubxona xatosi, tarmoqdan yuklanadi: {e}")
+        library_clip = None
+    if library_clip:
+        logger.info(f"📚 Kutubxonadan klip olindi: {Path(library_clip).name}")
+        return library_clip
+
+    uid = uuid.uuid4().hex[:12]
+    download_dir = workspace.dir if workspace else OUTPUT_DIR
+    download_dir.mkdir(parents=True, exist_ok=True)
+    output_template = str(download_dir / f"pubg_{uid}.%(ext)s")
 
     # PUBG Mobile uchun maxsus qidiruv so'rovlari
     search_queries = [
@@ -319,12 +1650,11 @@ def download_pubg_video(topic):
         "PUBG Mobile Erangel gameplay",
     ]
 
-    # Bir necha marta urinish
+    # Bir necha marta urinish - nomzodlar havzasi tugamaguncha qayta qidirilmaydi
     max_attempts = 5
+    pool = []
+    tried = set()
     for attempt in range(max_attempts):
-        search = random.choice(search_queries)
-        logger.info(f"🔍 Urinish {attempt + 1}/{max_attempts}: {search}")
-
         ydl_opts = {
             'format': 'best[height<=720][ext=mp4]/best[height<=720]/best',
             'outtmpl': output_template,
@@ -338,39 +1668,56 @@ def download_pubg_video(topic):
 
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Ko'proq video qidirish
-                info = ydl.extract_info(f"ytsearch20:{search}", download=False)
-
-                if not info or 'entries' not in info:
-                    continue
-
-                # Filtr: 20-300 soniya, PUBG Mobile bilan bog'liq
-                candidates = []
-                for v in info['entries']:
-                    if not v or not isinstance(v, dict):
-                        continue
-
-                    dur = v.get('duration') or 0
-                    title = v.get('title', '').lower()
-
-                    # Filtr shartlari
-                    if 20 < dur < 300:
-                        if 'pubg mobile' in title or 'pubg' in title:
-                            candidates.append(v)
-
-                if candidates:
-                    video = random.choice(candidates)
+                pool = [v for v in pool if v['webpage_url'] not in tried]
+                if not pool:
+                    search = random.choice(search_queries)
+                    logger.info(f"🔍 Urinish {attempt + 1}/{max_attempts}: {search}")
+                    pool = [v for v in search_pubg_candidates(ydl, search)
+                            if v.get('webpage_url') and v['webpage_url'] not in tried]
+                else:
+                    logger.info(f"🔁 Urinish {attempt + 1}/{max_attempts}: mavjud {len(pool)} ta nomzoddan")
+
+                if pool:
+                    video = random.choice(pool)
+                    tried.add(video['webpage_url'])
                     logger.info(f"📥 PUBG video topildi: {video.get('title', 'Unknown')[:100]}")
 
+                    # Faqat kerakli bo'lakni yuklash
+                    if SECTION_DOWNLOAD and clip_duration and FFMPEG_AVAILABLE:
+                        dur = video.get('duration') or 0
+                        window = min(clip_duration + SECTION_MARGIN_SECONDS, dur)
+                        if start_offset is not None:
+                            start = max(0.0, min(float(start_offset), dur - window))
+                        else:
+                            start = random.uniform(0, max(0.0, dur - window))
+
+                        try:
+                            with metrics.timer("pubg_step_duration_seconds", step="download"):
+                                download_video_section(video['webpage_url'], ydl_opts, start, start + window)
+                            candidate = find_downloaded_file(uid, min_size=100000, folder=download_dir)  # 100KB dan katta
+                            if candidate:
+                                metrics.inc("pubg_download_bytes_total", candidate.stat().st_size)
+                                logger.info(f"✅ PUBG bo'lak yuklandi: {candidate.name} "
+                                            f"({start:.0f}-{start + window:.0f}s)")
+                                return add_to_library(video, candidate, section_start=start)
+                        except Exception as e:
+                            logger.warning(f"Bo'lak yuklash xatosi: {e}")
+
+                        logger.warning("⚠️ Bo'lak yuklanmadi, to'liq video yuklanmoqda")
+                        # Chala bo'lak qolsa yt-dlp uni "yuklangan" deb o'tkazib yuboradi
+                        for partial in download_dir.glob(f"pubg_{uid}.*"):
+                            partial.unlink()
+
                     # Yuklash
-                    ydl.download([video['webpage_url']])
+                    with metrics.timer("pubg_step_duration_seconds", step="download"):
+                        ydl.download([video['webpage_url']])
 
                     # Yuklangan faylni topish
-                    for ext in ['mp4', 'webm', 'mkv']:
-                        candidate = OUTPUT_DIR / f"pubg_{uid}.{ext}"
-                        if candidate.exists() and candidate.stat().st_size > 500000:  # 500KB dan katta
-                            logger.info(f"✅ PUBG video yuklandi: {candidate.name}")
-                            return str(candidate)
+                    candidate = find_downloaded_file(uid, folder=download_dir)  # 500KB dan katta
+                    if candidate:
+                        metrics.inc("pubg_download_bytes_total", candidate.stat().st_size)
+                        logger.info(f"✅ PUBG video yuklandi: {candidate.name}")
+                        return add_to_library(video, candidate)
 
         except Exception as e:
             logger.error(f"Yuklash xatosi (urinish {attempt + 1}): {e}")
@@ -384,14 +1731,13 @@ def download_pubg_video(topic):
 # 4. FALLBACK VIDEO YARATISH (YANGI QO'SHILDI)
 # ============================================
 
-def create_fallback_video(duration=20):
+def create_fallback_video(duration=20, workspace=None):
     """Fallback video yaratish"""
     if not FFMPEG_AVAILABLE:
         logger.error("ffmpeg yo'q, fallback video yaratib bo'lmaydi")
         return None
 
-    uid = int(time.time())
-    video_path = OUTPUT_DIR / f"fallback_{uid}.mp4"
+    video_path = work_path(workspace, "fallback", "mp4")
 
     # PUBG style ranglar
     colors = ["0x1a1a2e", "0x16213e", "0x0f3460", "0x2c3e50", "0x1e3a5f"]
@@ -401,8 +1747,7 @@ def create_fallback_video(duration=20):
         'ffmpeg', '-y',
         '-f', 'lavfi',
         '-i', f'color=c={color}:s=720x1280:d={duration}:r=30',
-        '-c:v', 'libx264',
-        '-preset', 'ultrafast',
+        *encoder_args(),
         '-pix_fmt', 'yuv420p',
         '-t', str(duration),
         str(video_path)
@@ -410,70 +1755,165 @@ def create_fallback_video(duration=20):
 
     try:
         logger.info("🎨 Fallback video yaratilmoqda...")
-        result = subprocess.run(cmd, capture_output=True, timeout=60)
-
-        if result.returncode != 0:
-            logger.error(f"FFmpeg xatosi: {result.stderr.decode()[:200]}")
-            return None
+        run_media(cmd, workspace, duration=duration, op="fallback_video")
 
         if video_path.exists() and video_path.stat().st_size > 1000:
             logger.info(f"✅ Fallback video yaratildi: {video_path.name}")
+            metrics.inc("pubg_fallback_total", kind="video")
             return str(video_path)
         else:
             logger.error("Fallback video fayli yaratilmadi yoki juda kichik")
             return None
 
-    except subprocess.TimeoutExpired:
-        logger.error("Fallback video yaratish timeout")
-        return None
     except Exception as e:
         logger.error(f"Fallback video xatosi: {e}")
         return None
 
 
 # ============================================
-# 5. VIDEOGA EFFEKTLAR QO'SHISH
+# 4-A. MANBA VIDEONI KESISH (TRIM)
 # ============================================
 
-def add_pubg_effects(video_path):
-    """
-    PUBG Mobile style effektlar
-    - Yorqinlik, kontrast
-    - Rang korreksiyasi
-    - Vignette (qora ramka)
-    - Sharpen (aniqlik)
-    """
-    if not FFMPEG_AVAILABLE:
-        return video_path
+known_durations = {}
 
-    uid = int(time.time())
-    effect_path = OUTPUT_DIR / f"effect_{uid}.mp4"
 
-    # PUBG Mobile style effektlar (real o'yin uchun)
-    effects = [
-        # PUBG Mobile classic (slightly saturated, contrasty)
-        "eq=brightness=0.03:contrast=1.3:saturation=1.2,unsharp=3:3:0.5",
+def remember_media_duration(media_path, duration):
+    """Uzunlik oldindan ma'lum bo'lsa (masalan keshdan) ffprobe chaqirilmaydi"""
+    if duration:
+        known_durations[str(media_path)] = float(duration)
 
-        # PUBG Mobile vibrant (ranglar yorqin)
-        "eq=brightness=0.02:contrast=1.2:saturation=1.4,curves=vintage",
 
-        # PUBG Mobile cinematic (kino effekti)
-        "colorbalance=rs=0.1:gs=0.05:bs=-0.1,eq=contrast=1.4:gamma=1.1",
+def get_media_duration(media_path):
+    """ffprobe orqali media uzunligi (soniya)"""
+    if str(media_path) in known_durations:
+        return known_durations[str(media_path)]
+    duration_cmd = [
+        'ffprobe', '-v', 'error', '-show_entries',
+        'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
+        str(media_path)
+    ]
+    return float(subprocess.check_output(duration_cmd, timeout=30).decode().strip())
+
+
+def trim_source_clip(video_path, audio_duration, margin=None, workspace=None):
+    """
+    Manba videodan faqat kerakli oynani kesib olish
+    - Oyna = ovoz uzunligi + kichik zaxira
+    - Avval stream copy (keyframe'ga yopishadi, encode yo'q)
+    - Copy yetarli chiqmasa - faqat oynani tez qayta encode
+    """
+    if not FFMPEG_AVAILABLE:
+        return video_path
 
-        # PUBG Mobile action (harakat uchun)
-        "eq=contrast=1.5:brightness=0.04:saturation=1.3,unsharp=5:5:1.0",
+    if margin is None:
+        margin = TRIM_MARGIN_SECONDS
+
+    try:
+        source_duration = get_media_duration(video_path)
+    except Exception as e:
+        logger.warning(f"Manba uzunligi aniqlanmadi, kesilmaydi: {e}")
+        return video_path
+
+    window = audio_duration + margin
+    if source_duration <= window + 0.5:
+        return video_path
 
-        # PUBG Mobile warm (issiq ranglar)
-        "colorbalance=rs=0.15:gs=0.05:bs=-0.05,eq=contrast=1.2",
+    start = round(random.uniform(0, source_duration - window), 2)
+    trim_path = work_path(workspace, "trim", "mp4", scratch=True)
 
-        # PUBG Mobile cool (sovuq ranglar - tunda)
-        "colorbalance=rs=-0.1:gs=0.05:bs=0.2,eq=contrast=1.3",
+    copy_cmd = [
+        'ffmpeg', '-y',
+        '-ss', str(start),
+        '-i', video_path,
+        '-t', str(window),
+        '-map', '0:v:0',
+        '-c', 'copy',
+        '-an',
+        '-avoid_negative_ts', 'make_zero',
+        str(trim_path)
+    ]
 
-        # PUBG Mobile HDR style
-        "eq=contrast=1.4:brightness=0.05:saturation=1.2,curves=hdr",
+    encode_cmd = [
+        'ffmpeg', '-y',
+        '-ss', str(start),
+        '-i', video_path,
+        '-t', str(window),
+        '-map', '0:v:0',
+        *encoder_args(),
+        '-pix_fmt', 'yuv420p',
+        '-an',
+        str(trim_path)
     ]
 
-    selected_effect = random.choice(effects)
+    for mode, cmd in (("copy", copy_cmd), ("encode", encode_cmd)):
+        try:
+            run_media(cmd, workspace, duration=window, op="trim")
+            if not trim_path.exists() or trim_path.stat().st_size < 1000:
+                continue
+
+            # Keyframe siyrak bo'lsa copy oyna qisqa chiqishi mumkin
+            if get_media_duration(trim_path) + 0.1 < audio_duration:
+                logger.warning(f"Kesilgan oyna qisqa ({mode}), qayta uriniladi")
+                continue
+
+            logger.info(f"✂️ Manba kesildi ({mode}): {start:.1f}s dan {window:.1f}s "
+                        f"(asli {source_duration:.0f}s)")
+            return str(trim_path)
+
+        except MediaCancelled:
+            break
+        except Exception as e:
+            logger.warning(f"Kesish xatosi ({mode}): {e}")
+
+    if trim_path.exists():
+        trim_path.unlink()
+    logger.warning("⚠️ Manba kesilmadi, to'liq video ishlatiladi")
+    return video_path
+
+
+# ============================================
+# 5. VIDEOGA EFFEKTLAR QO'SHISH
+# ============================================
+
+# PUBG Mobile style effektlar (real o'yin uchun)
+PUBG_EFFECTS = [
+    # PUBG Mobile classic (slightly saturated, contrasty)
+    "eq=brightness=0.03:contrast=1.3:saturation=1.2,unsharp=3:3:0.5",
+
+    # PUBG Mobile vibrant (ranglar yorqin)
+    "eq=brightness=0.02:contrast=1.2:saturation=1.4,curves=vintage",
+
+    # PUBG Mobile cinematic (kino effekti)
+    "colorbalance=rs=0.1:gs=0.05:bs=-0.1,eq=contrast=1.4:gamma=1.1",
+
+    # PUBG Mobile action (harakat uchun)
+    "eq=contrast=1.5:brightness=0.04:saturation=1.3,unsharp=5:5:1.0",
+
+    # PUBG Mobile warm (issiq ranglar)
+    "colorbalance=rs=0.15:gs=0.05:bs=-0.05,eq=contrast=1.2",
+
+    # PUBG Mobile cool (sovuq ranglar - tunda)
+    "colorbalance=rs=-0.1:gs=0.05:bs=0.2,eq=contrast=1.3",
+
+    # PUBG Mobile HDR style
+    "eq=contrast=1.4:brightness=0.05:saturation=1.2,curves=hdr",
+]
+
+
+def add_pubg_effects(video_path, workspace=None):
+    """
+    PUBG Mobile style effektlar
+    - Yorqinlik, kontrast
+    - Rang korreksiyasi
+    - Vignette (qora ramka)
+    - Sharpen (aniqlik)
+    """
+    if not FFMPEG_AVAILABLE:
+        return video_path
+
+    effect_path = work_path(workspace, "effect", "mp4", scratch=True)
+
+    selected_effect = random.choice(PUBG_EFFECTS)
     logger.info(f"🎨 Effekt qo'shilmoqda: {selected_effect[:50]}...")
 
     try:
@@ -481,15 +1921,13 @@ def add_pubg_effects(video_path):
             'ffmpeg', '-y',
             '-i', video_path,
             '-vf', selected_effect,
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',
-            '-crf', '23',
+            *encoder_args(),
             '-pix_fmt', 'yuv420p',
             '-metadata', 'title=PUBG Mobile Gameplay',
             str(effect_path)
         ]
 
-        result = subprocess.run(effect_cmd, capture_output=True, timeout=180, check=True)
+        run_media(effect_cmd, workspace, op="effects")
 
         if effect_path.exists() and effect_path.stat().st_size > 1000:
             logger.info(f"✅ PUBG effekt qo'shildi")
@@ -507,7 +1945,45 @@ def add_pubg_effects(video_path):
 # 6. VIDEOGA TEXT QO'SHISH (PUBG STYLE)
 # ============================================
 
-def add_pubg_text(video_path, script_text):
+def build_text_filter(script_text):
+    """Script matnidan drawtext filtrlar zanjirini yasash"""
+    # Scriptni qismlarga bo'lish
+    words = script_text.split()
+    lines = []
+
+    if len(words) <= 8:
+        lines = [script_text]
+    else:
+        part_size = len(words) // 3
+        for i in range(0, len(words), part_size):
+            lines.append(' '.join(words[i:i + part_size]))
+
+    # PUBG style text filter
+    text_filters = []
+    y_positions = [1650, 1550, 1450]  # Pastki qism
+
+    for idx, line in enumerate(lines[:3]):
+        safe_line = line.replace("'", "\\'").replace('"', '\\"')
+
+        # PUBG style: Oq rang, qora kontur, yarim shaffof fon
+        text_filter = (
+            f"drawtext=text='{safe_line}':"
+            f"fontcolor=white:"
+            f"fontsize=45:"
+            f"borderw=3:"
+            f"bordercolor=black:"
+            f"x=(w-text_w)/2:"
+            f"y={y_positions[idx]}:"
+            f"box=1:"
+            f"boxcolor=black@0.5:"
+            f"boxborderw=15"
+        )
+        text_filters.append(text_filter)
+
+    return ','.join(text_filters)
+
+
+def add_pubg_text(video_path, script_text, workspace=None):
     """
     PUBG style matn qo'shish
     - Oq rang, qora kontur
@@ -517,56 +1993,20 @@ def add_pubg_text(video_path, script_text):
     if not FFMPEG_AVAILABLE:
         return video_path
 
-    uid = int(time.time())
-    text_path = OUTPUT_DIR / f"text_{uid}.mp4"
+    text_path = work_path(workspace, "text", "mp4", scratch=True)
 
     try:
-        # Scriptni qismlarga bo'lish
-        words = script_text.split()
-        lines = []
-
-        if len(words) <= 8:
-            lines = [script_text]
-        else:
-            part_size = len(words) // 3
-            for i in range(0, len(words), part_size):
-                lines.append(' '.join(words[i:i + part_size]))
-
-        # PUBG style text filter
-        text_filters = []
-        y_positions = [1650, 1550, 1450]  # Pastki qism
-
-        for idx, line in enumerate(lines[:3]):
-            safe_line = line.replace("'", "\\'").replace('"', '\\"')
-
-            # PUBG style: Oq rang, qora kontur, yarim shaffof fon
-            text_filter = (
-                f"drawtext=text='{safe_line}':"
-                f"fontcolor=white:"
-                f"fontsize=45:"
-                f"borderw=3:"
-                f"bordercolor=black:"
-                f"x=(w-text_w)/2:"
-                f"y={y_positions[idx]}:"
-                f"box=1:"
-                f"boxcolor=black@0.5:"
-                f"boxborderw=15"
-            )
-            text_filters.append(text_filter)
-
         # Matn qo'shish
         text_cmd = [
             'ffmpeg', '-y',
             '-i', video_path,
-            '-vf', ','.join(text_filters),
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',
-            '-crf', '23',
+            '-vf', build_text_filter(script_text),
+            *encoder_args(),
             '-pix_fmt', 'yuv420p',
             str(text_path)
         ]
 
-        result = subprocess.run(text_cmd, capture_output=True, timeout=180, check=True)
+        run_media(text_cmd, workspace, op="text")
 
         if text_path.exists() and text_path.stat().st_size > 1000:
             logger.info(f"✅ PUBG matn qo'shildi")
@@ -584,27 +2024,29 @@ def add_pubg_text(video_path, script_text):
 # 7. TRANSITION EFFEKTLARI
 # ============================================
 
-def add_transitions(video_path, audio_duration):
+def build_transition_filter(audio_duration):
+    """Fade in/out filtri"""
+    return f'fade=t=in:st=0:d=1,fade=t=out:st={audio_duration - 1.5}:d=1.5'
+
+
+def add_transitions(video_path, audio_duration, workspace=None):
     """Transition effektlari (fade in/out)"""
     if not FFMPEG_AVAILABLE:
         return video_path
 
-    uid = int(time.time())
-    transition_path = OUTPUT_DIR / f"transition_{uid}.mp4"
+    transition_path = work_path(workspace, "transition", "mp4", scratch=True)
 
     try:
         transition_cmd = [
             'ffmpeg', '-y',
             '-i', video_path,
-            '-vf', f'fade=t=in:st=0:d=1,fade=t=out:st={audio_duration - 1.5}:d=1.5',
-            '-c:v', 'libx264',
-            '-preset', 'ultrafast',
-            '-crf', '23',
+            '-vf', build_transition_filter(audio_duration),
+            *encoder_args(),
             '-pix_fmt', 'yuv420p',
             str(transition_path)
         ]
 
-        result = subprocess.run(transition_cmd, capture_output=True, timeout=180, check=True)
+        run_media(transition_cmd, workspace, duration=audio_duration, op="transitions")
 
         if transition_path.exists() and transition_path.stat().st_size > 1000:
             logger.info(f"✅ Transition qo'shildi")
@@ -621,58 +2063,262 @@ def add_transitions(video_path, audio_duration):
 # 8. OVOZ YARATISH (TUZATILGAN)
 # ============================================
 
-def create_audio_sync(text):
-    """Matndan ovoz yaratish (ishlaydigan versiya)"""
-    uid = f"{int(time.time())}_{random.randint(1000, 9999)}"
-    audio_path = OUTPUT_DIR / f"voice_{uid}.mp3"
+TTS_VOICES = [
+    "en-US-JennyNeural",  # Ayol ovozi (eng ishonchli)
+    "en-US-ChristopherNeural",  # Erkak ovozi
+    "en-US-GuyNeural",  # Erkak ovozi
+    "en-GB-RyanNeural",  # Britaniya erkak
+    "en-US-AriaNeural",  # Ayol ovozi
+]
 
-    voices = [
-        "en-US-JennyNeural",  # Ayol ovozi (eng ishonchli)
-        "en-US-ChristopherNeural",  # Erkak ovozi
-        "en-US-GuyNeural",  # Erkak ovozi
-        "en-GB-RyanNeural",  # Britaniya erkak
-        "en-US-AriaNeural",  # Ayol ovozi
-    ]
 
-    print("\n🔊 Ovoz yozish boshlandi...")
+class TTSService:
+    """
+    Doimiy asyncio loop'da ishlaydigan edge-tts xizmati
+    - Bitta fon thread + event loop (har urinishda yangi loop yaratilmaydi)
+    - submit() thread-safe, concurrent.futures.Future qaytaradi
+    - Bir vaqtda `concurrency` tagacha sintez
+    - Xato bergan ovoz jitter'li exponential backoff bilan chetga suriladi
+    """
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        voice = random.choice(voices)
+    def __init__(self, concurrency=3, max_retries=3, backoff_base=0.5):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._voice_failures = {}
+        self._voice_cooldown = {}
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            ready = threading.Event()
+
+            def run():
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                self._loop = loop
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                ready.set()
+                try:
+                    loop.run_forever()
+                finally:
+                    loop.close()
+
+            self._thread = threading.Thread(target=run, name="tts-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def submit(self, text, output_path, voices=None):
+        """Sintezni navbatga qo'yish; Future natijasi - ishlatilgan ovoz nomi"""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(
+            self._synthesize(text, str(output_path), list(voices or TTS_VOICES)),
+            self._loop
+        )
+
+    def stop(self):
+        if self._loop and self._thread and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+
+    def _pick_voice(self, voices):
+        now = time.time()
+        ready = [v for v in voices if self._voice_cooldown.get(v, 0) <= now]
+        if ready:
+            return random.choice(ready)
+        return min(voices, key=lambda v: self._voice_cooldown.get(v, 0))
+
+    def _mark_failure(self, voice):
+        failures = self._voice_failures.get(voice, 0) + 1
+        self._voice_failures[voice] = failures
+        delay = min(60.0, self.backoff_base * 2 ** failures)
+        self._voice_cooldown[voice] = time.time() + random.uniform(delay / 2, delay)
+
+    async def _synthesize(self, text, output_path, voices):
+        last_error = None
+        for attempt in range(self.max_retries):
+            voice = self._pick_voice(voices)
+            wait_for = self._voice_cooldown.get(voice, 0) - time.time()
+            if wait_for > 0:
+                await asyncio.sleep(wait_for)
+
+            print(f"   • Urinish {attempt + 1}/{self.max_retries}: {voice}")
+            try:
+                async with self._semaphore:
+                    communicate = edge_tts.Communicate(text, voice, rate=TTS_RATE, pitch=TTS_PITCH)
+                    await communicate.save(output_path)
+
+                if Path(output_path).exists() and Path(output_path).stat().st_size > 500:
+                    self._voice_failures[voice] = 0
+                    return voice
+                last_error = RuntimeError("bo'sh audio fayl")
+            except Exception as e:
+                last_error = e
+                print(f"   ❌ Ovoz xatosi: {e}")
+
+            self._mark_failure(voice)
+            # Full jitter: keyingi urinishdan oldin tasodifiy kutish
+            await asyncio.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+
+        raise RuntimeError(f"Edge-TTS {self.max_retries} urinishda ishlamadi: {last_error}")
+
+
+tts_service = TTSService(concurrency=TTS_CONCURRENCY, max_retries=TTS_MAX_RETRIES)
+atexit.register(tts_service.stop)
+
+
+class TTSCache:
+    """
+    Sintez qilingan ovozlar uchun disk keshi
+    - Kalit: sha256(matn, ovoz, rate, pitch)
+    - Har yozuv: <kalit>.mp3 + <kalit>.json (uzunlik va boshqa metadata)
+    - Hajm chegarasi, eng kam ishlatilgan (LRU) birinchi o'chiriladi
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # kalit -> hajm, eski -> yangi
+        self._load()
+
+    @staticmethod
+    def make_key(text, voice, rate=TTS_RATE, pitch=TTS_PITCH):
+        raw = json.dumps([text, voice, rate, pitch], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _audio_path(self, key):
+        return self.cache_dir / f"{key}.mp3"
+
+    def _meta_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def _load(self):
+        files = sorted(self.cache_dir.glob("*.mp3"), key=lambda f: f.stat().st_mtime)
+        for f in files:
+            if self._meta_path(f.stem).exists():
+                self._entries[f.stem] = f.stat().st_size
+            else:
+                f.unlink()
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(self._entries.values())
+
+    def get(self, text, voices):
+        """Istalgan ovoz uchun keshdagi yozuvni topish: (yo'l, metadata) yoki None"""
+        with self._lock:
+            for voice in voices:
+                key = self.make_key(text, voice)
+                if key not in self._entries:
+                    continue
+                path = self._audio_path(key)
+                try:
+                    meta = json.loads(self._meta_path(key).read_text(encoding='utf-8'))
+                    os.utime(path)  # LRU tartibi restartdan keyin ham saqlanadi
+                except (OSError, ValueError):
+                    self._entries.pop(key, None)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                remember_media_duration(path, meta.get("duration"))
+                return str(path), meta
+            self.misses += 1
+            return None
+
+    def put(self, text, voice, audio_path):
+        """Yangi sintez qilingan faylni keshga ko'chirish, kesh ichidagi yo'lni qaytaradi"""
+        key = self.make_key(text, voice)
+        path = self._audio_path(key)
         try:
-            print(f"   • Urinish {attempt + 1}/{max_retries}: {voice}")
+            duration = get_media_duration(audio_path)
+        except Exception:
+            duration = None
+
+        shutil.move(str(audio_path), str(path))
+        meta = {
+            "voice": voice,
+            "rate": TTS_RATE,
+            "pitch": TTS_PITCH,
+            "duration": duration,
+            "size": path.stat().st_size,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._meta_path(key).write_text(json.dumps(meta), encoding='utf-8')
+        remember_media_duration(path, duration)
+
+        with self._lock:
+            self._entries[key] = meta["size"]
+            self._entries.move_to_end(key)
+            self._evict()
+        return str(path)
+
+    def _evict(self):
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            total -= size
+            known_durations.pop(str(self._audio_path(key)), None)
+            for f in (self._audio_path(key), self._meta_path(key)):
+                try:
+                    f.unlink()
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
 
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
 
-            try:
-                communicate = edge_tts.Communicate(text, voice)
-                loop.run_until_complete(communicate.save(str(audio_path)))
+tts_cache = TTSCache(TTS_CACHE_DIR, int(TTS_CACHE_MB * 1024 * 1024))
 
-                if audio_path.exists() and audio_path.stat().st_size > 500:
-                    print(f"   ✅ Ovoz tayyor: {audio_path.name}")
-                    return str(audio_path)
 
-            except Exception as e:
-                print(f"   ❌ Ovoz xatosi: {e}")
-            finally:
-                loop.close()
-                asyncio.set_event_loop(None)
+def create_audio_sync(text, workspace=None):
+    """Matndan ovoz yaratish (kesh → umumiy TTS loop)"""
+    cached = tts_cache.get(text, TTS_VOICES)
+    if cached:
+        path, meta = cached
+        print(f"   ♻️ Ovoz keshdan olindi: {meta.get('voice')}")
+        return path
+
+    audio_path = work_path(workspace, "voice", "mp3")
 
-            time.sleep(1)
+    print("\n🔊 Ovoz yozish boshlandi...")
 
+    future = tts_service.submit(text, audio_path)
+    try:
+        with metrics.timer("pubg_step_duration_seconds", step="tts"):
+            voice = future.result(timeout=TTS_TIMEOUT_SECONDS)
+        print(f"   ✅ Ovoz tayyor: {audio_path.name} ({voice})")
+        try:
+            return tts_cache.put(text, voice, audio_path)
         except Exception as e:
-            print(f"   ❌ Kutilmagan xato: {e}")
-            time.sleep(1)
+            logger.warning(f"Ovoz keshga yozilmadi: {e}")
+            return str(audio_path)
+    except Exception as e:
+        # Timeout'da sintez davom etmasin: slotni bo'shatadi, keyin faylga yozmaydi
+        future.cancel()
+        print(f"   ❌ Ovoz xatosi: {str(e) or type(e).__name__}")
 
     print("⚠️ Edge-TTS ishlamadi, sun'iy ovoz yaratilmoqda")
-    return create_silent_audio()
+    return create_silent_audio(workspace)
 
 
-def create_silent_audio():
+def create_silent_audio(workspace=None):
     """Sun'iy ovoz (jim) yaratish"""
-    uid = int(time.time())
-    audio_path = OUTPUT_DIR / f"silent_{uid}.mp3"
+    audio_path = work_path(workspace, "silent", "mp3")
 
     try:
         cmd = [
@@ -685,10 +2331,11 @@ def create_silent_audio():
             str(audio_path)
         ]
 
-        result = subprocess.run(cmd, capture_output=True, timeout=10)
+        run_media(cmd, workspace, op="silent_audio")
 
         if audio_path.exists() and audio_path.stat().st_size > 100:
             print(f"   ✅ Sun'iy ovoz yaratildi")
+            metrics.inc("pubg_fallback_total", kind="silent_audio")
             return str(audio_path)
         else:
             print(f"   ❌ Sun'iy ovoz yaratilmadi")
@@ -703,48 +2350,84 @@ def create_silent_audio():
 # 9. PROFESSIONAL MONTAJ
 # ============================================
 
-def create_premium_video(video_path, audio_path, script_text, topic):
-    """PREMIUM MONTAJ"""
-    if not FFMPEG_AVAILABLE:
-        logger.error("ffmpeg yo'q!")
-        return None
+def render_single_pass(video_path, audio_path, script_text, audio_duration, workspace=None):
+    """
+    Bitta ffmpeg jarayonida to'liq montaj
+    - Fade in/out + PUBG effekt + matn bitta filtergraph'da
+    - Ovoz map qilinadi, -shortest va faststart
+    - Bitta libx264 encode (avval 3 ta encode + mux edi)
+    """
+    output_path = work_path(workspace, "premium", "mp4")
+
+    selected_effect = random.choice(PUBG_EFFECTS)
+    video_filters = [build_transition_filter(audio_duration), selected_effect]
+    text_filter = build_text_filter(script_text)
+    if text_filter:
+        video_filters.append(text_filter)
+    video_filters.append('format=yuv420p')
+
+    filtergraph = f"[0:v]{','.join(video_filters)}[v]"
+
+    render_cmd = [
+        'ffmpeg', '-y',
+        '-i', video_path,
+        '-i', audio_path,
+        '-filter_complex', filtergraph,
+        '-map', '[v]',
+        '-map', '1:a:0',
+        *encoder_args(),
+        '-c:a', 'aac',
+        '-shortest',
+        '-movflags', '+faststart',
+        '-metadata', 'title=PUBG Mobile Gameplay',
+        str(output_path)
+    ]
+
+    try:
+        logger.info(f"⚡ Bitta o'tishda montaj: {selected_effect[:50]}...")
+        run_media(render_cmd, workspace, duration=audio_duration, op="single_pass")
+
+        if output_path.exists() and output_path.stat().st_size > 1000:
+            logger.info(f"✅ PREMIUM VIDEO TAYYOR (1 o'tish): {output_path.name}")
+            return str(output_path)
+
+    except Exception as e:
+        logger.warning(f"Bitta o'tish montaj xatosi: {e}")
+
+    if output_path.exists():
+        output_path.unlink()
+    return None
 
+
+def render_multi_pass(video_path, audio_path, script_text, audio_duration, workspace=None):
+    """Eski ko'p bosqichli montaj (fallback)"""
     temp_files = []
     current_video = video_path
 
     try:
-        # Audio uzunligi
-        audio_duration_cmd = [
-            'ffprobe', '-v', 'error', '-show_entries',
-            'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
-            audio_path
-        ]
-        audio_duration = float(subprocess.check_output(audio_duration_cmd).decode().strip())
-
         # 1. TRANSITION EFFEKTLARI
         logger.info("✨ Transition effektlari qo'shilmoqda...")
-        transition_video = add_transitions(current_video, audio_duration)
+        transition_video = add_transitions(current_video, audio_duration, workspace=workspace)
         if transition_video != current_video:
             temp_files.append(transition_video)
             current_video = transition_video
 
         # 2. PUBG STYLE EFFEKTLAR
         logger.info("🎨 PUBG style effektlar qo'shilmoqda...")
-        effect_video = add_pubg_effects(current_video)
+        effect_video = add_pubg_effects(current_video, workspace=workspace)
         if effect_video != current_video:
             temp_files.append(effect_video)
             current_video = effect_video
 
         # 3. MATN QO'SHISH
         logger.info("📝 PUBG matn qo'shilmoqda...")
-        text_video = add_pubg_text(current_video, script_text)
+        text_video = add_pubg_text(current_video, script_text, workspace=workspace)
         if text_video != current_video:
             temp_files.append(text_video)
             current_video = text_video
 
         # 4. OVOZ QO'SHISH
-        uid = int(time.time())
-        output_path = OUTPUT_DIR / f"premium_{uid}.mp4"
+        output_path = work_path(workspace, "premium", "mp4")
 
         merge_cmd = [
             'ffmpeg', '-y',
@@ -757,7 +2440,7 @@ def create_premium_video(video_path, audio_path, script_text, topic):
             str(output_path)
         ]
 
-        subprocess.run(merge_cmd, capture_output=True, timeout=180, check=True)
+        run_media(merge_cmd, workspace, duration=audio_duration, op="merge")
 
         # Tozalash
         for f in temp_files:
@@ -776,32 +2459,71 @@ def create_premium_video(video_path, audio_path, script_text, topic):
         return None
 
 
+def create_premium_video(video_path, audio_path, script_text, topic, workspace=None):
+    """PREMIUM MONTAJ"""
+    if not FFMPEG_AVAILABLE:
+        logger.error("ffmpeg yo'q!")
+        return None
+
+    try:
+        # Audio uzunligi
+        audio_duration = get_media_duration(audio_path)
+    except Exception as e:
+        logger.error(f"Audio uzunligini aniqlab bo'lmadi: {e}")
+        return None
+
+    # 0. MANBANI KESISH - faqat ovoz uzunligidagi oyna encode qilinadi
+    source_video = trim_source_clip(video_path, audio_duration, workspace=workspace)
+
+    try:
+        output_path = None
+        if SINGLE_PASS_RENDER:
+            output_path = render_single_pass(source_video, audio_path, script_text, audio_duration,
+                                             workspace=workspace)
+            if output_path:
+                render_path = "single_pass"
+            else:
+                logger.warning("⚠️ Bitta o'tish ishlamadi, ko'p bosqichli montaj ishlatilmoqda")
+                metrics.inc("pubg_fallback_total", kind="multi_pass")
+
+        if not output_path:
+            output_path = render_multi_pass(source_video, audio_path, script_text, audio_duration,
+                                            workspace=workspace)
+            render_path = "multi_pass"
+
+        if output_path and workspace is not None:
+            workspace.render_path = render_path
+        return output_path
+
+    finally:
+        if source_video != video_path and Path(source_video).exists():
+            Path(source_video).unlink()
+
+
 # ============================================
 # 10. ODDIY MONTAJ (FALLBACK)
 # ============================================
 
-def simple_merge_audio_video(video_path, audio_path):
+def simple_merge_audio_video(video_path, audio_path, workspace=None):
     """Oddiy montaj"""
     if not FFMPEG_AVAILABLE:
         return None
 
-    uid = int(time.time())
-    output_path = OUTPUT_DIR / f"simple_{uid}.mp4"
+    output_path = work_path(workspace, "simple", "mp4")
 
     cmd = [
         'ffmpeg', '-y',
         '-i', video_path,
         '-i', audio_path,
-        '-c:v', 'libx264',
+        *encoder_args(),
         '-c:a', 'aac',
         '-shortest',
-        '-preset', 'ultrafast',
         '-pix_fmt', 'yuv420p',
         str(output_path)
     ]
 
     try:
-        subprocess.run(cmd, capture_output=True, timeout=180)
+        run_media(cmd, workspace, op="simple_merge")
         return str(output_path) if output_path.exists() else None
     except Exception as e:
         logger.error(f"Oddiy montaj xatosi: {e}")
@@ -812,8 +2534,92 @@ def simple_merge_audio_video(video_path, audio_path):
 # YOUTUBE UPLOAD
 # ============================================
 
-def upload_to_youtube(video_path, title, description):
-    """YouTube'ga yuklash"""
+class YouTubeClient:
+    """
+    Barcha upload worker'lar uchun bitta YouTube klienti
+    - Credentials bir marta yaratiladi, token faqat muddati tugashiga yaqin yangilanadi
+    - Service lokal discovery hujjatidan quriladi (tarmoqqa chiqmaydi)
+    - httplib2.Http thread-safe emas - har bir thread o'z AuthorizedHttp obyektini oladi
+    """
+
+    SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
+
+    def __init__(self, token_margin):
+        self.token_margin = timedelta(seconds=token_margin)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._creds = None
+        self._service = None
+        self._auth_request = None
+
+    def _token_fresh(self):
+        creds = self._creds
+        if not creds.token or creds.expiry is None:
+            return False
+        # google-auth expiry - naive UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now > self.token_margin
+
+    def credentials(self):
+        """Yaroqli credentials (kerak bo'lsa yangilanadi); xato bo'lsa exception"""
+        with self._lock:
+            if self._creds is None:
+                self._creds = Credentials(
+                    token=None,
+                    refresh_token=GOOGLE_REFRESH_TOKEN,
+                    token_uri="https://oauth2.googleapis.com/token",
+                    client_id=GOOGLE_CLIENT_ID,
+                    client_secret=GOOGLE_CLIENT_SECRET,
+                    scopes=self.SCOPES
+                )
+                self._auth_request = Request()
+            if not self._token_fresh():
+                self._creds.refresh(self._auth_request)
+                logger.info("✅ Google token yangilandi")
+            return self._creds
+
+    def service(self):
+        creds = self.credentials()
+        with self._lock:
+            if self._service is None:
+                doc = get_static_doc("youtube", "v3")
+                if doc:
+                    self._service = build_from_document(doc, credentials=creds)
+                else:
+                    self._service = build("youtube", "v3", credentials=creds, cache_discovery=False)
+            return self._service
+
+    def http(self):
+        """Joriy thread uchun avtorizatsiyalangan HTTP (token yangilash shu ichida)"""
+        creds = self.credentials()
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=120))
+            self._local.http = http
+        return http
+
+
+youtube_client = YouTubeClient(YOUTUBE_TOKEN_MARGIN) if GOOGLE_AVAILABLE else None
+
+
+UPLOAD_CHUNK_UNIT = 256 * 1024  # Resumable protokol: chunk 256 KB ga karrali bo'lishi shart
+UPLOAD_RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def upload_chunk_size(rate):
+    """Tezlik (bayt/s) bo'yicha chunk: ~UPLOAD_CHUNK_SECONDS davom etadigan, 256 KB karrali"""
+    size = int(rate * UPLOAD_CHUNK_SECONDS) // UPLOAD_CHUNK_UNIT * UPLOAD_CHUNK_UNIT
+    return max(UPLOAD_CHUNK_UNIT, min(size, 64 * 1024 * 1024))
+
+
+def upload_to_youtube(video_path, title, description, on_progress=None, session=None, on_session=None):
+    """
+    YouTube'ga yuklash; muvaffaqiyatsiz bo'lsa None (ish checkpoint'dan qayta uriniladi)
+    - session: oldingi resumable sessiya {uri, offset, size, path} - shu joydan davom etiladi
+    - on_session(session): sessiya URI va offset har chunkdan keyin saqlanishi uchun
+    - on_progress(foiz, bayt/s): haqiqiy yuklash tezligi bilan
+    - Chunk hajmi o'lchangan tezlikka moslashadi, xatolarda full-jitter exponential backoff
+    """
     if not GOOGLE_AVAILABLE:
         url = f"https://youtube.com/shorts/demo_{int(time.time())}"
         logger.warning(f"Google API yo'q, demo URL: {url}")
@@ -824,23 +2630,11 @@ def upload_to_youtube(video_path, title, description):
         return f"https://youtube.com/shorts/noauth_{int(time.time())}"
 
     try:
-        creds = Credentials(
-            token=None,
-            refresh_token=GOOGLE_REFRESH_TOKEN,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            scopes=["https://www.googleapis.com/auth/youtube.upload"]
-        )
-
         try:
-            creds.refresh(Request())
-            logger.info("✅ Google token yangilandi")
+            youtube = youtube_client.service()
         except Exception as e:
             logger.error(f"Token refresh xato: {e}")
-            return f"https://youtube.com/shorts/token_error_{int(time.time())}"
-
-        youtube = build("youtube", "v3", credentials=creds)
+            return None
 
         safe_title = title[:90].strip()
 
@@ -857,10 +2651,11 @@ def upload_to_youtube(video_path, title, description):
             }
         }
 
+        file_size = Path(video_path).stat().st_size
         media = MediaFileUpload(
             str(video_path),
             mimetype='video/mp4',
-            chunksize=1024 * 1024,
+            chunksize=upload_chunk_size(UPLOAD_CHUNK_MB * 1024 * 1024 / UPLOAD_CHUNK_SECONDS),
             resumable=True
         )
 
@@ -870,21 +2665,74 @@ def upload_to_youtube(video_path, title, description):
             media_body=media
         )
 
+        # Oldingi sessiya (restartdan oldin) - server haqiqiy offsetni Range bilan qaytaradi
+        if session and session.get("path") == str(video_path) and session.get("size") == file_size:
+            request_obj.resumable_uri = session["uri"]
+            request_obj.resumable_progress = session.get("offset", 0)
+            request_obj._in_error_state = True
+            logger.info(f"♻️ YouTube sessiyasi davom ettirilmoqda: {session.get('offset', 0) / 1048576:.1f} MB dan")
+
+        def save_session():
+            if on_session and request_obj.resumable_uri:
+                on_session({"uri": request_obj.resumable_uri, "offset": request_obj.resumable_progress,
+                            "size": file_size, "path": str(video_path)})
+
         response = None
         retry = 0
+        rate = None  # bayt/s, EWMA
+        t_start = time.time()
+        start_offset = request_obj.resumable_progress
         while response is None:
+            offset = request_obj.resumable_progress
+            t0 = time.time()
             try:
-                status, response = request_obj.next_chunk()
-                if status:
-                    pct = int(status.progress() * 100)
-                    logger.info(f"YouTube: {pct}% yuklandi")
-            except Exception as chunk_e:
+                # Uzun yuklashda token muddati tugashiga yaqinlashsa shu yerda yangilanadi
+                http = youtube_client.http()
+                status, response = request_obj.next_chunk(http=http)
+            except (HttpError, httplib2.HttpLib2Error, OSError) as chunk_e:
+                code = getattr(getattr(chunk_e, "resp", None), "status", None)
+                if code in (404, 410):
+                    # Sessiya muddati o'tgan - boshidan yangi sessiya
+                    logger.warning("YouTube sessiyasi eskirgan, qaytadan boshlanmoqda")
+                    request_obj.resumable_uri = None
+                    request_obj.resumable_progress = 0
+                    request_obj._in_error_state = False
+                elif code is not None and code not in UPLOAD_RETRY_STATUSES:
+                    logger.error(f"YouTube xato {code}: {chunk_e}")
+                    return None
+
                 retry += 1
-                if retry > 5:
+                if retry > UPLOAD_MAX_RETRIES:
                     logger.error("YouTube chunk xato, to'xtaldi")
-                    break
-                logger.warning(f"Chunk urinish {retry}: {chunk_e}")
-                time.sleep(3)
+                    save_session()
+                    return None
+                # Xatoda chunk kichrayadi - uzilish ehtimoli va qayta yuboriladigan hajm kamayadi
+                media._chunksize = max(UPLOAD_CHUNK_UNIT, media._chunksize // 2 // UPLOAD_CHUNK_UNIT * UPLOAD_CHUNK_UNIT)
+                delay = random.uniform(0, min(UPLOAD_BACKOFF_CAP, 2 ** retry))
+                logger.warning(f"Chunk urinish {retry}: {chunk_e} ({delay:.1f}s kutiladi)")
+                time.sleep(delay)
+                continue
+
+            retry = 0
+            sent = request_obj.resumable_progress - offset if status else file_size - offset
+            elapsed = time.time() - t0
+            metrics.inc("pubg_upload_bytes_total", max(0, sent))
+            if sent > 0 and elapsed > 0:
+                rate = sent / elapsed if rate is None else 0.7 * rate + 0.3 * sent / elapsed
+                media._chunksize = upload_chunk_size(rate)
+            if status:
+                save_session()
+                pct = int(status.progress() * 100)
+                logger.info(f"YouTube: {pct}% yuklandi ({(rate or 0) / 1048576:.2f} MB/s, "
+                            f"chunk {media._chunksize // 1024} KB)")
+                if on_progress:
+                    on_progress(pct, rate or 0)
+
+        total = time.time() - t_start
+        avg = (file_size - start_offset) / total if total > 0 else 0
+        logger.info(f"📶 YouTube: {file_size / 1048576:.1f} MB, {total:.1f}s, o'rtacha {avg / 1048576:.2f} MB/s")
+        if on_progress:
+            on_progress(100, avg)
 
         if response and 'id' in response:
             url = f"https://www.youtube.com/shorts/{response['id']}"
@@ -892,164 +2740,866 @@ def upload_to_youtube(video_path, title, description):
             return url
 
         logger.error("YouTube response noto'g'ri")
-        return f"https://youtube.com/shorts/upload_failed_{int(time.time())}"
+        return None
 
     except Exception as e:
         logger.error(f"YouTube upload xato: {e}")
-        return f"https://youtube.com/shorts/error_{int(time.time())}"
+        return None
 
 
 # ============================================
 # STATUS YANGILASH
 # ============================================
 
-def update_status(message, status="working", progress=None, topic=None):
-    with log_lock:
-        bot_status["message"] = message
-        bot_status["status"] = status
-        if progress is not None:
-            bot_status["progress"] = progress
+def update_status(message, status="working", progress=None, topic=None, job_id=None):
+    ts = datetime.now().strftime("%H:%M:%S")
+    with bot_status.transaction() as tx:
+        job = tx.job(job_id) if job_id else None
+        if job is not None:
+            fields = {"message": message, "status": status, "updated": ts}
+            if progress is not None:
+                # Parallel bosqichlarda progress orqaga ketmasin
+                fields["progress"] = max(job["progress"], progress) if status == "working" else progress
+            if topic:
+                fields["topic"] = topic
+            tx.update_job(job_id, **fields)
+            message = f"[{job_id}] {message}"
+            # Boshqa ish davom etayotgan bo'lsa umumiy holat "working" qoladi
+            if any(j["status"] == "working" for j in tx.all_jobs().values()):
+                status = "working"
+        tx.set(message=message, status=status)
         if topic:
-            bot_status["current_topic"] = topic
-        ts = datetime.now().strftime("%H:%M:%S")
-        bot_status["logs"].insert(0, f"[{ts}] {message}")
-        bot_status["logs"] = bot_status["logs"][:50]
+            tx.set(current_topic=topic)
+        tx.log(f"[{ts}] {message}")
     logger.info(message)
 
 
+def set_job_progress(job_id, progress):
+    """Faqat progressni oshirish (ffmpeg progress oqimi uchun - log yozilmaydi)"""
+    with bot_status.transaction() as tx:
+        job = tx.job(job_id)
+        if job is not None and job["status"] == "working" and progress > job["progress"]:
+            tx.update_job(job_id, progress=progress)
+
+
+def is_persistent_file(path):
+    """Fayl doimiy kesh ichidami (ish tugagach o'chirilmasin)"""
+    try:
+        Path(path).resolve().relative_to(DATA_DIR.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def remove_job_files(values):
+    """Ishning oraliq fayllarini o'chirish (DATA_DIR keshlari qoladi)"""
+    for f in values:
+        try:
+            if isinstance(f, str) and f and Path(f).is_file() and not is_persistent_file(f):
+                Path(f).unlink()
+        except OSError:
+            pass
+
+
+def remove_job_workspace(job_id, kit=None):
+    """Ish (va u ishlatgan kit) katalogini butunlay o'chirish"""
+    JobWorkspace(job_id).remove()
+    if kit and kit.get("workspace"):
+        JobWorkspace(kit["workspace"], ephemeral=False).remove()
+
+
 # ============================================
-# ASOSIY JARAYON
+# ISHLAR OMBORI (SQLITE, CHECKPOINT)
 # ============================================
 
-def process_video():
-    """Premium video yaratish"""
-    files_to_clean = []
+class JobStore:
+    """
+    Ishlarning doimiy ombori: data/jobs.db (SQLite)
+    - jobs: ish holati (queued / working / uploading / success / error / cancelled), kit, urinishlar soni
+    - checkpoints: har bir tugagan bosqich natijasi (mavzu, script, fayl yo'llari, URL)
+    - Restartdan keyin tugallanmagan ishlar navbatga qaytadi va
+      oxirgi tugagan bosqichdan davom etadi
+    """
+
+    # Natijasi fayl yo'li bo'lgan bosqichlar - fayl yo'qolsa checkpoint yaroqsiz
+    FILE_STAGES = ("audio", "video", "render")
+
+    def __init__(self, db_path, retention_hours):
+        self.retention = retention_hours * 3600
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                source TEXT,
+                status TEXT,
+                kit TEXT,
+                error TEXT,
+                attempts INTEGER DEFAULT 0,
+                created REAL,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT,
+                stage TEXT,
+                value TEXT,
+                created REAL,
+                PRIMARY KEY (job_id, stage)
+            );
+        """)
+        self._db.commit()
+
+    def create(self, job_id, source, kit=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, source, status, kit, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, source, json.dumps(kit, ensure_ascii=False) if kit else None, now, now)
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["kit"] = json.loads(job["kit"]) if job["kit"] else None
+        return job
+
+    def set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ?, "
+                "attempts = attempts + (? = 'working') WHERE id = ?",
+                (status, error, time.time(), status, job_id)
+            )
+            self._db.commit()
+
+    def checkpoint(self, job_id, stage, value):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, stage, value, created) VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+
+    def checkpoints(self, job_id):
+        """Yaroqli checkpoint'lar: {bosqich: natija}; fayli yo'qolganlari tashlanadi"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stage, value FROM checkpoints WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        results = {r["stage"]: json.loads(r["value"]) for r in rows}
+        for stage in self.FILE_STAGES:
+            if stage in results and not Path(results[stage]).exists():
+                del results[stage]
+        return results
+
+    def unfinished(self):
+        """Restartda davom ettiriladigan ishlar (eng eskisi birinchi)"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'working', 'uploading') ORDER BY created"
+            ).fetchall()
+        return [r["id"] for r in rows]
+
+    def prune(self):
+        """Muddati o'tgan ishlar va ularning oraliq fayllarini o'chirish"""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kit FROM jobs WHERE status IN ('success', 'error', 'cancelled') AND updated < ?", (cutoff,)
+            ).fetchall()
+            ids = [r["id"] for r in rows]
+            for row in rows:
+                job_id = row["id"]
+                values = self._db.execute(
+                    "SELECT value FROM checkpoints WHERE job_id = ?", (job_id,)
+                ).fetchall()
+                remove_job_files(json.loads(v["value"]) for v in values)
+                remove_job_workspace(job_id, json.loads(row["kit"]) if row["kit"] else None)
+                self._db.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+        return len(ids)
+
+
+job_store = JobStore(DATA_DIR / "jobs.db", JOB_RETENTION_HOURS)
+
+
+# ============================================
+# BOSQICHLAR REJALASHTIRUVCHISI (DAG)
+# ============================================
+
+class StageError(Exception):
+    """Bosqich muvaffaqiyatsiz (xabar foydalanuvchiga ko'rsatiladi)"""
+
+
+def critical_path(deps_map, finished_at):
+    """Eng oxirgi tugagan bosqichdan orqaga - eng kech tugagan bog'liqlik bo'yicha"""
+    if not finished_at:
+        return []
+    node = max(finished_at, key=finished_at.get)
+    path = [node]
+    while True:
+        deps = [d for d in deps_map.get(node, []) if d in finished_at]
+        if not deps:
+            break
+        node = max(deps, key=finished_at.get)
+        path.append(node)
+    return path[::-1]
 
+
+def needed_stages(deps_map, results):
+    """Bajarilishi kerak bo'lgan bosqichlar: natijasi yo'q va kimgadir (yoki oxirgi) kerak"""
+    consumers = {name: [n for n, deps in deps_map.items() if name in deps] for name in deps_map}
+    memo = {}
+
+    def needed(name):
+        if name not in memo:
+            memo[name] = name not in results and (
+                not consumers[name] or any(needed(c) for c in consumers[name]))
+        return memo[name]
+
+    return {name for name in deps_map if needed(name)}
+
+
+def run_stage_graph(stages, results=None, job_id=None, on_result=None):
+    """
+    Bosqichlarni bog'liqlik bo'yicha bajarish (kichik DAG executor)
+    - stages: [(nom, [bog'liqliklar], func)], func(results) -> natija
+    - Bog'liqliklari tayyor bo'lgan bosqich darhol parallel boshlanadi
+    - results da oldindan bor bosqichlar (va faqat ular uchun kerak bo'lganlar) bajarilmaydi
+    - on_result(nom, natija) - har bir tugagan bosqichdan keyin (checkpoint)
+    - Har bir bosqich vaqti va kritik yo'l ish holatiga yoziladi
+    """
+    results = {} if results is None else results
+    deps_map = {name: deps for name, deps, _ in stages}
+    todo = needed_stages(deps_map, results)
+    pending = {name: (deps, func) for name, deps, func in stages if name in todo}
+    running = {}
+    timings = {}
+    started_at = {}
+    finished_at = {}
+    t0 = time.time()
+    error = None
+
+    pool = ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix=f"stage-{job_id}")
     try:
-        update_status("🔄 Jarayon boshlandi...", status="working", progress=5)
-
-        # 1. MAVZU YARATISH
-        update_status("🎯 AI mavzu yaratmoqda...", progress=10)
-        topic = generate_unique_topic()
-        update_status(f"📌 Mavzu: {topic}", progress=15, topic=topic)
-        time.sleep(0.5)
-
-        # 2. SCRIPT YARATISH
-        update_status("📝 AI script yozmoqda...", progress=20)
-        script = generate_unique_script(topic)
-        update_status("✅ Script tayyor", progress=25)
-        time.sleep(0.5)
-
-        # 3. OVOZ YARATISH
-        update_status("🎙️ Ovoz yozilmoqda...", progress=30)
-        audio_path = create_audio_sync(script)
+        while (pending or running) and error is None:
+            for name, (deps, func) in list(pending.items()):
+                if all(d in results for d in deps):
+                    del pending[name]
+                    started_at[name] = time.time() - t0
+                    timings[name] = {"start": round(started_at[name], 2)}
+                    running[pool.submit(func, results)] = name
+
+            if not running:
+                error = StageError(f"❌ Bosqichlar bajarilmadi: {', '.join(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                finished_at[name] = time.time() - t0
+                duration = finished_at[name] - started_at[name]
+                timings[name]["duration"] = round(duration, 2)
+                metrics.observe("pubg_stage_duration_seconds", duration, stage=name)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if on_result:
+                    on_result(name, results[name])
+
+        # Xato bo'lsa ham boshlangan bosqichlar tugashi kutiladi - natijasi checkpoint bo'ladi
+        for fut in running:
+            try:
+                results[running[fut]] = fut.result()
+            except Exception:
+                continue
+            if on_result:
+                on_result(running[fut], results[running[fut]])
+    finally:
+        pool.shutdown(wait=True)
+
+    path = critical_path(deps_map, finished_at)
+    if job_id:
+        bot_status.update_job(job_id, timings={n: t.get("duration") for n, t in timings.items()},
+                              critical_path=path)
+    summary = ", ".join(f"{n} {t.get('duration', 0):.1f}s" for n, t in timings.items())
+    logger.info(f"⏱️ Bosqichlar: {summary} | kritik yo'l: {' → '.join(path)} "
+                f"({time.time() - t0:.1f}s)")
+
+    if error is not None:
+        raise error
+    return results
+
+
+# ============================================
+# ASOSIY JARAYON
+# ============================================
+
+def process_video(job_id):
+    """
+    Premium video yaratish (bitta ish, render worker'da)
+    - Mavzu → script → ovoz va mavzu → video yuklash parallel
+    - Montaj ovoz va video tayyor bo'lganda boshlanadi
+    - Tayyor video upload_queue ga beriladi - worker keyingi renderga o'tadi
+    - Har bir bosqich natijasi job_store ga yoziladi; qayta urinishda
+      oxirgi tugagan bosqichdan davom etiladi
+    """
+    results = {}
+    drafts = {}
+    handed_off = False
+    workspace = JobWorkspace(job_id)
+
+    with queued_jobs_lock:
+        queued_jobs.discard(job_id)
+    # Bekor qilish uchun ro'yxatga olinadi; navbatda bekor qilingan ish bajarilmaydi
+    with active_workspaces_lock:
+        if job_id in active_workspaces:
+            logger.warning(f"⚠️ Ish allaqachon bajarilmoqda, takror navbat yozuvi o'tkazildi: {job_id}")
+            return
+        active_workspaces[job_id] = workspace
+    if (job_store.get(job_id) or {}).get("status") == "cancelled":
+        with active_workspaces_lock:
+            active_workspaces.pop(job_id, None)
+        return
+
+    # Tayyor kit bo'lsa mavzu/script/ovoz/video bosqichlari o'tkazib yuboriladi
+    kit = (bot_status.job(job_id) or {}).get("kit")
+    if kit:
+        results.update({k: kit[k] for k in ("topic", "script", "audio", "video")
+                        if k not in JobStore.FILE_STAGES or Path(kit[k]).exists()})
+        update_status(f"📦 Tayyor kit ishlatilmoqda: {kit['topic']}", progress=60,
+                      topic=kit["topic"], job_id=job_id)
+
+    saved = job_store.checkpoints(job_id)
+    if saved:
+        results.update(saved)
+        update_status(f"♻️ Davom ettirilmoqda ({', '.join(saved)} tayyor)",
+                      topic=results.get("topic"), job_id=job_id)
+    job_store.set_status(job_id, "working")
+
+    def stage_topic(r):
+        update_status("🎯 AI mavzu yaratmoqda...", progress=10, job_id=job_id)
+        combined = generate_topic_and_script() if GROQ_COMBINED else None
+        if combined:
+            topic, drafts["script"] = combined
+        else:
+            topic = generate_unique_topic()
+        update_status(f"📌 Mavzu: {topic}", progress=15, topic=topic, job_id=job_id)
+        return topic
+
+    def stage_script(r):
+        if drafts.get("script"):
+            script = drafts["script"]
+        else:
+            update_status("📝 AI script yozmoqda...", progress=20, job_id=job_id)
+            script = generate_unique_script(r["topic"])
+        update_status("✅ Script tayyor", progress=25, job_id=job_id)
+        return script
+
+    def stage_audio(r):
+        update_status("🎙️ Ovoz yozilmoqda...", progress=30, job_id=job_id)
+        audio_path = create_audio_sync(r["script"], workspace=workspace)
         if not audio_path:
-            update_status("⚠️ Ovoz yaratilmadi! Sun'iy ovoz ishlatiladi.", progress=30)
-            audio_path = create_silent_audio()
+            update_status("⚠️ Ovoz yaratilmadi! Sun'iy ovoz ishlatiladi.", progress=30, job_id=job_id)
+            audio_path = create_silent_audio(workspace)
             if not audio_path:
-                update_status("❌ Ovoz yaratilmadi!", status="error", progress=0)
-                return
-        files_to_clean.append(audio_path)
-        update_status("✅ Ovoz tayyor", progress=40)
-        time.sleep(0.5)
+                raise StageError("❌ Ovoz yaratilmadi!")
+        update_status("✅ Ovoz tayyor", progress=40, job_id=job_id)
+        return audio_path
 
-        # 4. REAL VIDEO YUKLASH
-        update_status("🔍 PUBG Mobile video qidirilmoqda...", progress=50)
-        video_path = download_pubg_video(topic)
+    def stage_video(r):
+        # Faqat mavzuga bog'liq - ovoz uzunligi hali noma'lum, shuning uchun maksimal oyna
+        update_status("🔍 PUBG Mobile video qidirilmoqda...", progress=20, job_id=job_id)
+        video_path = download_pubg_video(r["topic"], clip_duration=SOURCE_CLIP_SECONDS, workspace=workspace)
 
         if not video_path:
-            update_status("⚠️ PUBG video topilmadi, fallback video yaratilmoqda...", progress=55)
-            video_path = create_fallback_video(duration=20)
+            update_status("⚠️ PUBG video topilmadi, fallback video yaratilmoqda...", progress=55, job_id=job_id)
+            with resource_scheduler.admit(workspace):
+                video_path = create_fallback_video(duration=20, workspace=workspace)
 
         if not video_path:
-            update_status("❌ Video topilmadi!", status="error", progress=0)
-            return
+            raise StageError("❌ Video topilmadi!")
 
-        files_to_clean.append(video_path)
-        update_status("✅ Video yuklandi", progress=60)
-        time.sleep(0.5)
+        update_status("✅ Video yuklandi", progress=60, job_id=job_id)
+        return video_path
 
-        # 5. PREMIUM MONTAJ
-        update_status("✨ Premium montaj qilinmoqda...", progress=70)
+    def stage_render(r):
+        if resource_scheduler.busy():
+            update_status("⏳ Montaj uchun CPU bo'shashi kutilmoqda...", progress=65, job_id=job_id)
+        with resource_scheduler.admit(workspace):
+            update_status("✨ Premium montaj qilinmoqda...", progress=70, job_id=job_id)
+            workspace.on_progress = lambda fraction: set_job_progress(job_id, 70 + int(fraction * 20))
+            final_path = create_premium_video(r["video"], r["audio"], r["script"], r["topic"], workspace=workspace)
 
-        final_path = create_premium_video(video_path, audio_path, script, topic)
+            if not final_path:
+                logger.warning("⚠️ Premium montaj ishlamadi, oddiy montaj ishlatilmoqda")
+                metrics.inc("pubg_fallback_total", kind="simple_merge")
+                final_path = simple_merge_audio_video(r["video"], r["audio"], workspace=workspace)
+                workspace.render_path = "simple_merge"
 
         if not final_path:
-            logger.warning("⚠️ Premium montaj ishlamadi, oddiy montaj ishlatilmoqda")
-            final_path = simple_merge_audio_video(video_path, audio_path)
+            raise StageError("❌ Montaj muvaffaqiyatsiz!")
+        bot_status.update_job(job_id, render_path=workspace.render_path)
 
-        if not final_path:
-            update_status("❌ Montaj muvaffaqiyatsiz!", status="error", progress=0)
-            return
+        update_status("✅ Montaj tayyor", progress=90, job_id=job_id)
+        return final_path
 
-        files_to_clean.append(final_path)
-        update_status("✅ Montaj tayyor", progress=90)
-        time.sleep(0.5)
+    def cancellable(func):
+        def run(r):
+            if workspace.cancelled.is_set():
+                raise MediaCancelled("Bekor qilindi")
+            return func(r)
+        return run
 
-        # 6. YOUTUBE'GA YUKLASH
-        update_status("📤 YouTube'ga yuklanmoqda...", progress=95)
-        video_url = upload_to_youtube(
-            final_path,
-            f"{topic} 🔥 PUBG Tips",
-            script
-        )
+    try:
+        if not kit and not saved:
+            update_status("🔄 Jarayon boshlandi...", status="working", progress=5, job_id=job_id)
+
+        run_stage_graph([
+            ("topic", [], cancellable(stage_topic)),
+            ("script", ["topic"], cancellable(stage_script)),
+            ("audio", ["script"], cancellable(stage_audio)),
+            ("video", ["topic"], cancellable(stage_video)),
+            ("render", ["audio", "video"], cancellable(stage_render)),
+        ], results=results, job_id=job_id,
+            on_result=lambda stage, value: job_store.checkpoint(job_id, stage, value))
+
+        job_store.set_status(job_id, "uploading")
+        bot_status.update_job(job_id, upload={"status": "queued", "progress": 0})
+        update_status("📤 Yuklash navbatida...", progress=92, job_id=job_id)
+        upload_queue.put(job_id)
+        handed_off = True
 
-        # 7. STATISTIKA
-        bot_status["total_videos"] += 1
-        bot_status["last_video_url"] = video_url
-        bot_status["last_run"] = datetime.now().strftime("%H:%M")
+    except Exception as e:
+        # ffmpeg fallback'lari MediaCancelled ni yutib yuborishi mumkin - signal tekshiriladi
+        if workspace.cancelled.is_set():
+            update_status("🚫 Ish bekor qilindi", status="cancelled", job_id=job_id)
+        elif isinstance(e, StageError):
+            update_status(str(e), status="error", progress=0, job_id=job_id)
+        else:
+            logger.error(f"Xato: {traceback.format_exc()}")
+            update_status(f"❌ Xato: {str(e)[:50]}", status="error", job_id=job_id)
 
-        update_status(f"✅ Video tayyor! {video_url}", status="success", progress=100)
+    finally:
+        with active_workspaces_lock:
+            active_workspaces.pop(job_id, None)
+        # Xato bo'lsa bosqich natijalari checkpoint sifatida qayta urinish uchun qoladi,
+        # faqat oraliq (scratch) fayllar o'chiriladi
+        workspace.clear_scratch()
+        if not handed_off and workspace.cancelled.is_set():
+            job_store.set_status(job_id, "cancelled")
+            finish_job(job_id)
+        elif not handed_off:
+            fail_job(job_id)
+
+
+def fail_job(job_id):
+    """Ishni muvaffaqiyatsiz yakunlash (to'xtatish paytida uzilgan ish restartda tiklanadi)"""
+    if not workers_stopping.is_set():
+        job_store.set_status(job_id, "error", error=(bot_status.job(job_id) or {}).get("message"))
+    finish_job(job_id)
+
+
+def upload_video(job_id):
+    """
+    Render tugagan ishni YouTube'ga yuklash (upload worker'da)
+    - Kirishlar checkpoint'lardan olinadi (render, mavzu, script)
+    - Yuklash holati ish ichida alohida: job["upload"]
+    - Oraliq fayllar faqat muvaffaqiyatli yuklashdan keyin o'chiriladi
+    """
+    job = job_store.get(job_id)
+    results = dict((job or {}).get("kit") or {})
+    results.update(job_store.checkpoints(job_id))
+    succeeded = False
+
+    def report(upload_status, pct=None, rate=None):
+        upload = dict((bot_status.job(job_id) or {}).get("upload") or {}, status=upload_status)
+        if pct is not None:
+            upload["progress"] = pct
+        if rate is not None:
+            upload["mbps"] = round(rate * 8 / 1e6, 2)
+        bot_status.update_job(job_id, upload=upload)
+
+    try:
+        if "render" not in results:
+            raise StageError("❌ Render fayli topilmadi!")
+
+        video_url = results.get("upload")
+        if not video_url:
+            report("uploading", 0)
+            update_status("📤 YouTube'ga yuklanmoqda...", progress=95, job_id=job_id)
+            t0 = time.time()
+            video_url = upload_to_youtube(
+                results["render"],
+                f"{results['topic']} 🔥 PUBG Tips",
+                results["script"],
+                on_progress=lambda pct, rate: report("uploading", pct, rate),
+                session=results.get("upload_session"),
+                on_session=lambda sess: job_store.checkpoint(job_id, "upload_session", sess)
+            )
+            timings = dict((bot_status.job(job_id) or {}).get("timings") or {})
+            timings["upload"] = round(time.time() - t0, 2)
+            metrics.observe("pubg_stage_duration_seconds", timings["upload"], stage="upload")
+            bot_status.update_job(job_id, timings=timings)
+            if not video_url:
+                raise StageError("❌ YouTube'ga yuklanmadi! (qayta urinish mumkin)")
+            job_store.checkpoint(job_id, "upload", video_url)
+        report("done", 100)
+
+        # STATISTIKA
+        with bot_status.transaction() as tx:
+            tx.incr("total_videos")
+            tx.set(last_video_url=video_url, last_run=datetime.now().strftime("%H:%M"))
+            tx.update_job(job_id, video_url=video_url)
+
+        update_status(f"✅ Video tayyor! {video_url}", status="success", progress=100, job_id=job_id)
+        succeeded = True
+
+    except StageError as e:
+        report("error")
+        update_status(str(e), status="error", progress=0, job_id=job_id)
 
     except Exception as e:
-        logger.error(f"Xato: {traceback.format_exc()}")
-        update_status(f"❌ Xato: {str(e)[:50]}", status="error")
+        report("error")
+        logger.error(f"Upload xato: {traceback.format_exc()}")
+        update_status(f"❌ Xato: {str(e)[:50]}", status="error", job_id=job_id)
 
     finally:
-        time.sleep(3)
-        for f in files_to_clean:
+        if succeeded:
+            remove_job_files(results.get(key) for key in ("audio", "video", "render"))
+            remove_job_workspace(job_id, (job or {}).get("kit"))
+            job_store.set_status(job_id, "success")
+            finish_job(job_id)
+        else:
+            fail_job(job_id)
+
+
+# ============================================
+# TAYYOR ISHLAR ZAXIRASI (WARM POOL)
+# ============================================
+
+class WarmPool:
+    """
+    Bo'sh vaqtda K ta tayyor "kit" saqlash: mavzu, script, ovoz, kesilgan manba klip
+    - Fon thread faqat hech qanday ish bajarilmayotganda kit yig'adi
+    - max_age dan eski kitlar tashlanadi (fayllari o'chiriladi)
+    - Ro'yxat data/kits.json da saqlanadi - restartdan keyin ham ishlatiladi
+    """
+
+    def __init__(self, path, size, max_age_hours, interval):
+        self.path = Path(path)
+        self.size = size
+        self.max_age = max_age_hours * 3600
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._kits = []
+        self._load()
+
+    def _load(self):
+        try:
+            kits = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        self._kits = [k for k in kits if Path(k["audio"]).exists() and Path(k["video"]).exists()]
+
+    def _save(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._kits, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _discard(kit):
+        remove_job_files(kit.get(key) for key in ("audio", "video"))
+        if kit.get("workspace"):
+            JobWorkspace(kit["workspace"], ephemeral=False).remove()
+
+    def drop_stale(self):
+        now = time.time()
+        with self._lock:
+            fresh = [k for k in self._kits if now - k["created"] < self.max_age]
+            stale = [k for k in self._kits if now - k["created"] >= self.max_age]
+            if stale:
+                self._kits = fresh
+                self._save()
+        for kit in stale:
+            logger.info(f"🗑️ Eskirgan kit tashlandi: {kit['topic']}")
+            self._discard(kit)
+
+    def take(self):
+        """Eng eski yaroqli kitni olish (yo'q bo'lsa None)"""
+        self.drop_stale()
+        with self._lock:
+            while self._kits:
+                kit = self._kits.pop(0)
+                self._save()
+                if Path(kit["audio"]).exists() and Path(kit["video"]).exists():
+                    return kit
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._kits)
+
+    def build_kit(self):
+        """Bitta to'liq kit tayyorlash; yaroqsiz bo'lsa None"""
+        kit_id = uuid.uuid4().hex[:8]
+        workspace = JobWorkspace(f"kit-{kit_id}", ephemeral=False)
+        try:
+            kit = self._build_kit(kit_id, workspace)
+        except Exception:
+            workspace.remove()
+            raise
+        if kit is None:
+            workspace.remove()
+        return kit
+
+    def _build_kit(self, kit_id, workspace):
+        combined = generate_topic_and_script() if GROQ_COMBINED else None
+        if combined:
+            topic, script = combined
+        else:
+            topic = generate_unique_topic()
+            script = generate_unique_script(topic)
+
+        audio_path = create_audio_sync(script, workspace=workspace)
+        # Sun'iy (jim) ovozli kit saqlanmaydi - faqat keshdagi haqiqiy ovoz
+        if not audio_path or not is_persistent_file(audio_path):
+            return None
+        audio_duration = get_media_duration(audio_path)
+
+        video_path = download_pubg_video(topic, clip_duration=audio_duration, workspace=workspace)
+        if not video_path:
+            return None
+        # Fon ishi: asosiy renderlar kutmayotganda va past ustuvorlikda
+        with resource_scheduler.admit(workspace, background=True):
+            video_path = trim_source_clip(video_path, audio_duration, workspace=workspace)
+
+        return {
+            "id": kit_id,
+            "workspace": workspace.name,
+            "created": time.time(),
+            "topic": topic,
+            "script": script,
+            "audio": audio_path,
+            "video": video_path,
+        }
+
+    def run(self):
+        while not workers_stopping.is_set():
             try:
-                if Path(f).exists():
-                    Path(f).unlink()
-            except:
-                pass
-        time.sleep(1)
-        update_status("🤖 Bot kutmoqda...", status="idle", progress=0)
+                self.drop_stale()
+                busy = any(not j["finished"] for j in bot_status.jobs().values())
+                if not busy and len(self) < self.size:
+                    logger.info(f"📦 Kit tayyorlanmoqda ({len(self) + 1}/{self.size})...")
+                    kit = self.build_kit()
+                    if kit:
+                        with self._lock:
+                            self._kits.append(kit)
+                            self._save()
+                        logger.info(f"✅ Kit tayyor: {kit['topic']}")
+                        continue
+                    logger.warning("⚠️ Kit tayyorlanmadi")
+            except Exception as e:
+                logger.error(f"Warm pool xato: {e}")
+            workers_stopping.wait(self.interval)
+
+    def start(self):
+        if self.size > 0:
+            threading.Thread(target=self.run, name="warm-pool", daemon=True).start()
 
 
 # ============================================
 # WORKER VA SCHEDULER
 # ============================================
 
-def worker():
+worker_threads = []
+workers_stopping = threading.Event()
+# Render qilinayotgan ishlar katalogi (bekor qilish signali shu orqali)
+active_workspaces = {}
+active_workspaces_lock = threading.Lock()
+# video_queue dagi ishlar: bekor qilingan ish qayta urinilsa navbatga ikkinchi marta qo'yilmaydi
+queued_jobs = set()
+queued_jobs_lock = threading.Lock()
+
+
+def submit_job(source="manual", kit=None):
+    """Yangi ish yaratib navbatga qo'yish, job_id qaytaradi (kit - tayyor kirishlar)"""
+    job_id = uuid.uuid4().hex[:8]
+    job_store.create(job_id, source, kit)
+    enqueue_job(job_id, source, kit)
+    logger.info(f"📥 Ish navbatga qo'shildi: {job_id} ({source}{', kit' if kit else ''})")
+    return job_id
+
+
+def enqueue_job(job_id, source, kit=None):
+    """Ishni holat omboriga qo'shib worker navbatiga qo'yish"""
+    with bot_status.transaction() as tx:
+        # Tugagan eski ishlarni xotiradan tozalash
+        finished = [j for j in tx.all_jobs().values() if j["finished"]]
+        for old_job in sorted(finished, key=lambda j: j["finished"])[:max(0, len(finished) - JOB_HISTORY)]:
+            tx.remove_job(old_job["id"])
+
+        tx.add_job(job_id, {
+            "id": job_id,
+            "source": source,
+            "status": "queued",
+            "message": "⏳ Navbatda",
+            "progress": 0,
+            "topic": "",
+            "video_url": None,
+            "created": datetime.now().strftime("%H:%M:%S"),
+            "updated": None,
+            "finished": None,
+            "kit": kit,
+        })
+    with queued_jobs_lock:
+        already_queued = job_id in queued_jobs
+        queued_jobs.add(job_id)
+    if not already_queued:
+        video_queue.put(job_id)
+    report_queue_sizes()
+
+
+def retry_job(job_id):
+    """Muvaffaqiyatsiz ishni checkpoint'lardan qayta navbatga qo'yish"""
+    job = job_store.get(job_id)
+    if job is None or job["status"] not in ("error", "cancelled"):
+        return False
+    job_store.set_status(job_id, "queued")
+    enqueue_job(job_id, job["source"], job["kit"])
+    logger.info(f"🔁 Ish qayta navbatga qo'yildi: {job_id}")
+    return True
+
+
+def cancel_job(job_id):
+    """Navbatdagi yoki render qilinayotgan ishni bekor qilish (yuklashdagi ish to'xtatilmaydi)"""
+    job = bot_status.job(job_id)
+    if job is None or job["finished"]:
+        return False
+    with active_workspaces_lock:
+        workspace = active_workspaces.get(job_id)
+    if workspace is not None:
+        workspace.cancelled.set()
+        logger.info(f"🚫 Ish bekor qilinmoqda: {job_id}")
+        return True
+    if job["status"] == "queued":
+        job_store.set_status(job_id, "cancelled")
+        update_status("🚫 Ish bekor qilindi", status="cancelled", job_id=job_id)
+        finish_job(job_id)
+        return True
+    return False
+
+
+def prune_jobs():
+    """JOB_RETENTION_HOURS dan eski tugagan ishlar va ularning fayllarini o'chirish"""
+    try:
+        removed = job_store.prune()
+    except Exception as e:
+        logger.error(f"Eski ishlarni tozalash xatosi: {e}")
+        return
+    if removed:
+        logger.info(f"🗑️ {removed} ta eski ish tozalandi")
+
+
+def recover_jobs():
+    """Restartdan keyin: tugallanmagan ishlarni navbatga qaytarish, eskilarini tozalash"""
+    JobWorkspace.cleanup_stale()
+    prune_jobs()
+    for job_id in job_store.unfinished():
+        job = job_store.get(job_id)
+        job_store.set_status(job_id, "queued")
+        enqueue_job(job_id, job["source"], job["kit"])
+        logger.info(f"♻️ Ish tiklandi: {job_id}")
+
+
+def finish_job(job_id):
+    """Ishni tugagan deb belgilash"""
+    with bot_status.transaction() as tx:
+        job = tx.job(job_id)
+        if job is not None:
+            tx.update_job(job_id, finished=datetime.now().strftime("%H:%M:%S"),
+                          status="error" if job["status"] == "working" else job["status"])
+        active = [j for j in tx.all_jobs().values() if not j["finished"]]
+    if not active:
+        update_status("🤖 Bot kutmoqda...", status="idle")
+
+
+def pending_jobs_count():
+    return sum(1 for j in bot_status.jobs().values() if j["status"] == "queued")
+
+
+def report_queue_sizes():
+    bot_status.set(queue_size=video_queue.qsize(), upload_queue_size=upload_queue.qsize())
+
+
+def worker(worker_id, queue, handler):
+    """Worker: navbatdan ish olib handler(job_id) ni bajaradi (None - to'xtash)"""
     while True:
+        job_id = queue.get()
         try:
-            if not video_queue.empty():
-                func = video_queue.get(timeout=1)
-                bot_status["queue_size"] = video_queue.qsize()
-                try:
-                    func()
-                except Exception as e:
-                    logger.error(f"Worker xato: {e}")
-                finally:
-                    video_queue.task_done()
-                    bot_status["queue_size"] = video_queue.qsize()
-        except:
-            pass
-        time.sleep(0.5)
+            if job_id is None:
+                return
+            report_queue_sizes()
+            with metrics.working(worker_id.rsplit("-", 1)[0], worker_id):
+                handler(job_id)
+        except Exception as e:
+            logger.error(f"Worker-{worker_id} xato: {e}")
+        finally:
+            queue.task_done()
+            report_queue_sizes()
+
+
+def start_workers(count=None, upload_count=None):
+    count = count or RENDER_WORKERS
+    upload_count = upload_count or UPLOAD_WORKERS
+    for kind, queue, handler, n in (("render", video_queue, process_video, count),
+                                    ("upload", upload_queue, upload_video, upload_count)):
+        for i in range(n):
+            t = threading.Thread(target=worker, args=(f"{kind}-{i + 1}", queue, handler),
+                                 name=f"{kind}-worker-{i + 1}", daemon=True)
+            t.start()
+            worker_threads.append((queue, t))
+    logger.info(f"👷 {count} ta render va {upload_count} ta upload worker ishga tushdi")
+
+
+def shutdown_workers(timeout=30):
+    """Worker'larni toza to'xtatish: joriy ishlar tugaydi, keyin chiqiladi"""
+    if workers_stopping.is_set():
+        return
+    workers_stopping.set()
+    for queue, _ in worker_threads:
+        queue.put(None)
+    deadline = time.time() + timeout
+    for _, t in worker_threads:
+        t.join(max(0, deadline - time.time()))
+    logger.info("🛑 Render va upload worker'lar to'xtatildi")
+
+
+atexit.register(shutdown_workers)
+
+warm_pool = WarmPool(DATA_DIR / "kits.json", WARM_POOL_SIZE, KIT_MAX_AGE_HOURS, WARM_POOL_INTERVAL)
 
 
 def scheduled_job():
-    if bot_status["mode"] == "auto":
+    if bot_status.get("mode") == "auto":
         logger.info("⏰ Avtomatik video boshlandi")
-        video_queue.put(process_video)
-        bot_status["queue_size"] = video_queue.qsize()
+        submit_job(source="schedule", kit=warm_pool.take())
 
 
 def run_scheduler():
     import schedule
     schedule.every().day.at("09:00").do(scheduled_job)
     schedule.every().day.at("19:00").do(scheduled_job)
+    # Uzoq ishlaydigan jarayonda ham xato/bekor qilingan ishlar fayllari diskni to'ldirmasin
+    schedule.every().hour.do(prune_jobs)
 
     while True:
         try:
@@ -1057,7 +3607,7 @@ def run_scheduler():
             jobs = schedule.get_jobs()
             if jobs:
                 nxt = min(jobs, key=lambda j: j.next_run).next_run
-                bot_status["next_run"] = nxt.strftime("%H:%M")
+                bot_status.set(next_run=nxt.strftime("%H:%M"))
         except Exception as e:
             logger.error(f"Scheduler xato: {e}")
         time.sleep(30)
@@ -1074,39 +3624,159 @@ def index():
 
 @app.route('/api/status')
 def api_status():
-    bot_status["queue_size"] = video_queue.qsize()
-    return jsonify(bot_status)
+    """To'liq holat; ?since=<seq> - faqat shu versiyadan keyingi o'zgarishlar"""
+    report_queue_sizes()
+    since = request.args.get("since", type=int)
+    if since is not None:
+        return jsonify(bot_status.delta(since))
+    return jsonify(bot_status.snapshot())
+
+
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events: o'zgarishlar push qilinadi (event: full / delta)"""
+    last = request.args.get("since", type=int)
+    if last is None:
+        last = request.headers.get("Last-Event-ID", type=int)
+
+    def stream():
+        seq = last
+        if seq is None:
+            snapshot = bot_status.snapshot()
+            seq = snapshot["seq"]
+            yield f"id: {seq}\nevent: full\ndata: {json.dumps({'seq': seq, 'full': True, 'state': snapshot})}\n\n"
+
+        while True:
+            if not bot_status.wait_for_change(seq, timeout=15):
+                yield ": keepalive\n\n"
+                continue
+            delta = bot_status.delta(seq)
+            seq = delta["seq"]
+            event = "full" if delta["full"] else "delta"
+            yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(delta)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route('/api/run', methods=['POST'])
 def api_run():
-    if bot_status["status"] == "working":
-        return jsonify({"error": "Bot hozir ishlayapti, kuting!"}), 400
     if not FFMPEG_AVAILABLE:
         return jsonify({"error": "ffmpeg o'rnatilmagan!"}), 500
-    video_queue.put(process_video)
-    bot_status["queue_size"] = video_queue.qsize()
-    return jsonify({"success": True})
+    if workers_stopping.is_set():
+        return jsonify({"error": "Bot to'xtatilmoqda"}), 503
+    if pending_jobs_count() >= MAX_PENDING_JOBS:
+        return jsonify({"error": "Navbat to'la, keyinroq urinib ko'ring!"}), 429
+    job_id = submit_job(source="manual", kit=warm_pool.take())
+    return jsonify({"success": True, "job_id": job_id})
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    job = bot_status.job(job_id)
+    if job is None:
+        return jsonify({"error": "Ish topilmadi"}), 404
+    return jsonify(job)
+
+
+@app.route('/api/jobs/<job_id>/retry', methods=['POST'])
+def api_job_retry(job_id):
+    if workers_stopping.is_set():
+        return jsonify({"error": "Bot to'xtatilmoqda"}), 503
+    if not retry_job(job_id):
+        return jsonify({"error": "Ish topilmadi yoki qayta urinib bo'lmaydi"}), 404
+    return jsonify({"success": True, "job_id": job_id})
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_job_cancel(job_id):
+    if not cancel_job(job_id):
+        return jsonify({"error": "Ish topilmadi yoki bekor qilib bo'lmaydi"}), 409
+    return jsonify({"success": True, "job_id": job_id})
 
 
 @app.route('/api/mode/auto', methods=['POST'])
 def set_auto():
-    bot_status["mode"] = "auto"
+    bot_status.set(mode="auto")
     return jsonify({"success": True})
 
 
 @app.route('/api/mode/manual', methods=['POST'])
 def set_manual():
-    bot_status["mode"] = "manual"
+    bot_status.set(mode="manual")
     return jsonify({"success": True})
 
 
 @app.route('/api/topics')
 def api_topics():
-    topics = []
-    for _ in range(10):
-        topics.append(generate_unique_topic())
-    return jsonify(topics)
+    """
+    ?n=10 - mavzular JSON ro'yxati (standart)
+    ?stream=1 yoki Accept: application/x-ndjson - NDJSON oqimi (har qatorda bitta, tayyor bo'lishi bilan)
+    """
+    n = max(1, min(request.args.get("n", 10, type=int), TOPIC_BATCH_MAX))
+
+    wants_stream = (request.args.get("stream") in ("1", "true")
+                    or "application/x-ndjson" in request.headers.get("Accept", ""))
+    if not wants_stream:
+        return jsonify(list(generate_topic_batch(n)))
+
+    def stream():
+        for idx, topic in enumerate(generate_topic_batch(n)):
+            yield json.dumps({"index": idx, "topic": topic}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+
+@app.route('/api/cache')
+def api_cache():
+    return jsonify({
+        "tts": tts_cache.stats(),
+        "library": clip_library.stats(),
+        "search": search_cache.stats(),
+    })
+
+
+@app.route('/api/resources')
+def api_resources():
+    return jsonify(resource_scheduler.stats())
+
+
+def collect_gauges():
+    """/metrics uchun joriy holat: navbatlar, worker bandligi, encode slotlari, ishlar"""
+    kinds = {"render": 0, "upload": 0}
+    for _, t in worker_threads:
+        if t.is_alive():
+            kind = t.name.split("-")[0]
+            kinds[kind] = kinds.get(kind, 0) + 1
+    busy, busy_seconds = metrics.busy()
+    resources = resource_scheduler.stats()
+    statuses = {}
+    for job in bot_status.jobs().values():
+        statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+    return [
+        ("pubg_queue_depth", "gauge", "Navbatdagi ishlar",
+         [({"queue": "render"}, video_queue.qsize()), ({"queue": "upload"}, upload_queue.qsize())]),
+        ("pubg_workers", "gauge", "Ishlayotgan worker thread'lar",
+         [({"kind": k}, n) for k, n in kinds.items()]),
+        ("pubg_workers_busy", "gauge", "Hozir ish bajarayotgan worker'lar",
+         [({"kind": k}, busy.get(k, 0)) for k in kinds]),
+        ("pubg_worker_busy_seconds_total", "counter",
+         "Worker'lar band bo'lgan jami vaqt (utilizatsiya = rate / pubg_workers)",
+         [({"kind": k}, round(busy_seconds.get(k, 0.0), 3)) for k in kinds]),
+        ("pubg_encode_slots", "gauge", "Encode slotlari", [({}, resources["slots"])]),
+        ("pubg_encode_slots_busy", "gauge", "Band encode slotlari", [({}, len(resources["active"]))]),
+        ("pubg_encode_waiting", "gauge", "Slot kutayotgan encode'lar", [({}, resources["waiting"])]),
+        ("pubg_jobs", "gauge", "Xotiradagi ishlar holat bo'yicha",
+         [({"status": k}, n) for k, n in sorted(statuses.items())]),
+        ("pubg_videos_total", "counter", "Yuklangan videolar", [({}, bot_status.get("total_videos", 0))]),
+        ("pubg_topics_generated_total", "counter", "Yaratilgan yangi mavzular",
+         [({}, bot_status.get("topics_generated", 0))]),
+    ]
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(collect_gauges()), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.route('/api/check')
@@ -1142,13 +3812,16 @@ def create_html_template():
         .run-btn{background:#667eea;color:#fff;font-size:20px;padding:15px;width:100%}
         .status{background:#0f3460;padding:20px;border-radius:10px;margin:20px 0}
         .topic{background:#1a1a2e;padding:10px;border-left:4px solid gold;margin:10px 0}
-        .stats{display:grid;grid-template-columns:repeat(5,1fr);gap:10px;margin:20px 0}
+        .stats{display:grid;grid-template-columns:repeat(6,1fr);gap:10px;margin:20px 0}
         .stat{background:#0f3460;padding:10px;text-align:center}
         .number{font-size:24px;color:gold}
         .logs{background:#0f3460;padding:10px;max-height:200px;overflow-y:auto}
         .log{padding:3px;border-bottom:1px solid #333;font-family:monospace}
         .steps{display:grid;grid-template-columns:repeat(5,1fr);gap:5px;margin:10px 0;font-size:12px}
         .step{background:#1a1a2e;padding:5px;border-radius:5px;text-align:center}
+        .job{background:#1a1a2e;padding:8px;margin:5px 0;border-radius:5px;font-size:13px}
+        .bar{background:#333;height:6px;border-radius:3px;margin-top:5px}
+        .bar div{background:gold;height:6px;border-radius:3px}
     </style>
 </head>
 <body>
@@ -1174,6 +3847,7 @@ def create_html_template():
         <div class="status">
             <div id="statusMsg">Bot ishga tayyor</div>
             <div class="topic" id="topicBox">Mavzu: --</div>
+            <div id="jobs"></div>
         </div>
 
         <div class="stats">
@@ -1182,6 +3856,7 @@ def create_html_template():
             <div class="stat"><div class="number" id="last">--:--</div>Oxirgi</div>
             <div class="stat"><div class="number" id="next">09:00</div>Keyingi</div>
             <div class="stat"><div class="number" id="queue">0</div>Navbat</div>
+            <div class="stat"><div class="number" id="uploads">0</div>Upload</div>
         </div>
 
         <div id="videoLink"></div>
@@ -1191,29 +3866,59 @@ def create_html_template():
     </div>
 
     <script>
-        function update(){
-            fetch('/api/status').then(r=>r.json()).then(d=>{
-                document.getElementById('statusMsg').innerHTML=d.message
-                if(d.current_topic) document.getElementById('topicBox').innerHTML='Mavzu: '+d.current_topic
-                document.getElementById('total').innerHTML=d.total_videos
-                document.getElementById('topics').innerHTML=d.topics_generated
-                document.getElementById('last').innerHTML=d.last_run||'--:--'
-                document.getElementById('next').innerHTML=d.next_run||'09:00'
-                document.getElementById('queue').innerHTML=d.queue_size
-
-                let auto=document.getElementById('autoBtn')
-                let manual=document.getElementById('manualBtn')
-                if(d.mode=='auto'){auto.classList.add('active');manual.classList.remove('active')}
-                else{manual.classList.add('active');auto.classList.remove('active')}
-
-                document.getElementById('runBtn').disabled=(d.status=='working')
-                if(d.logs) document.getElementById('logs').innerHTML=d.logs.map(l=>'<div class="log">'+l+'</div>').join('')
+        let state=null, seq=null, pollTimer=null
+        function render(d){
+            document.getElementById('statusMsg').innerHTML=d.message
+            if(d.current_topic) document.getElementById('topicBox').innerHTML='Mavzu: '+d.current_topic
+            document.getElementById('total').innerHTML=d.total_videos
+            document.getElementById('topics').innerHTML=d.topics_generated
+            document.getElementById('last').innerHTML=d.last_run||'--:--'
+            document.getElementById('next').innerHTML=d.next_run||'09:00'
+            document.getElementById('queue').innerHTML=d.queue_size
+            document.getElementById('uploads').innerHTML=d.upload_queue_size||0
+
+            let auto=document.getElementById('autoBtn')
+            let manual=document.getElementById('manualBtn')
+            if(d.mode=='auto'){auto.classList.add('active');manual.classList.remove('active')}
+            else{manual.classList.add('active');auto.classList.remove('active')}
+
+            let active=Object.values(d.jobs||{}).filter(j=>!j.finished)
+            document.getElementById('jobs').innerHTML=active.map(j=>'<div class="job">#'+j.id+' '+j.message+
+                (j.upload?'':' <a href="#" onclick="cancelJob(\''+j.id+'\');return false">✖</a>')+
+                (j.upload?' | 📤 '+j.upload.status+' '+(j.upload.progress||0)+'%'+(j.upload.mbps?' '+j.upload.mbps+' Mbit/s':''):'')+
+                '<div class="bar"><div style="width:'+j.progress+'%"></div></div></div>').join('')
+            if(d.logs) document.getElementById('logs').innerHTML=d.logs.map(l=>'<div class="log">'+l+'</div>').join('')
+        }
+        // Delta: faqat o'zgargan maydonlar, ishlar (null = o'chirilgan) va yangi loglar
+        function apply(delta){
+            if(delta.full||!state){state=delta.state}
+            else{
+                Object.assign(state,delta.changes)
+                for(const id in delta.jobs){
+                    if(delta.jobs[id]===null) delete state.jobs[id]
+                    else state.jobs[id]=delta.jobs[id]
+                }
+                state.logs=delta.logs.concat(state.logs||[]).slice(0,50)
+            }
+            seq=delta.seq
+            render(state)
+        }
+        function poll(){
+            fetch(seq===null?'/api/status':'/api/status?since='+seq).then(r=>r.json()).then(d=>{
+                apply(seq===null?{full:true,seq:d.seq,state:d}:d)
             })
         }
+        function startPolling(){if(!pollTimer){pollTimer=setInterval(poll,2000);poll()}}
+        function update(){if(pollTimer) poll()}
         function setMode(m){fetch('/api/mode/'+m,{method:'POST'}).then(()=>update())}
         function runBot(){fetch('/api/run',{method:'POST'})}
-        setInterval(update,2000)
-        update()
+        function cancelJob(id){fetch('/api/jobs/'+id+'/cancel',{method:'POST'})}
+        if(window.EventSource){
+            let es=new EventSource('/api/events')
+            es.addEventListener('full',e=>apply(JSON.parse(e.data)))
+            es.addEventListener('delta',e=>apply(JSON.parse(e.data)))
+            es.onerror=()=>{es.close();startPolling()}
+        } else startPolling()
     </script>
 </body>
 </html>'''
@@ -1224,11 +3929,564 @@ def create_html_template():
     logger.info(f"✅ HTML template: {html_path}")
 
 
+# ============================================
+# ENCODER BENCHMARK
+# ============================================
+
+BENCH_PRESETS = ["ultrafast", "superfast", "veryfast", "faster"]
+BENCH_CRFS = [23, 26, 28]
+
+
+def make_reference_clip(workspace, duration):
+    """Sintetik 720x1280 referens (shovqinli - gameplay kabi siqilishi qiyin)"""
+    ref = workspace.path("reference", "mp4")
+    run_media([
+        'ffmpeg', '-y',
+        '-f', 'lavfi',
+        '-i', f'testsrc2=s=720x1280:r=30:d={duration},noise=alls=12:allf=t+u',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '12',
+        '-pix_fmt', 'yuv420p',
+        str(ref)
+    ], workspace)
+    return ref
+
+
+def benchmark_encoder(source=None, duration=15, presets=None, crfs=None, threads_options=None,
+                      upload_mbps=UPLOAD_MBPS, write=True):
+    """
+    x264 preset / CRF / thread matritsasini shu hostda o'lchash va profil tanlash
+    - Har bir kombinatsiya render filtrlari bilan encode qilinadi: fps, hajm
+    - Taxminiy yuklash vaqti = hajm / upload_mbps (UPLOAD_WORKERS ga bo'linadi)
+    - Encode narxi = vaqt / slotlar; slotlar ResourceScheduler.plan dan - profil tanlangach
+      productionda aynan shu slot va thread soni ishlatiladi
+    - Tanlov: eng kichik "tor joy" (max(encode, upload)), teng bo'lsa kichik fayl
+    - Natija data/encoder_profile.json ga yoziladi - render yo'li shuni ishlatadi
+    """
+    cores = detect_cpu_count()
+    presets = presets or BENCH_PRESETS
+    crfs = crfs or BENCH_CRFS
+    memory = detect_memory_bytes()
+    # cores // RENDER_WORKERS - barcha renderlar birga yadrolarni to'liq band qiladigan variant
+    threads_options = threads_options or sorted({1, 2, max(1, cores // RENDER_WORKERS), cores}
+                                                & set(range(1, cores + 1)))
+    workspace = JobWorkspace(f"bench-{uuid.uuid4().hex[:8]}")
+    results = []
+
+    try:
+        if source:
+            reference = source
+            duration = get_media_duration(source)
+        else:
+            print(f"🎞️ Referens klip yaratilmoqda ({duration}s)...")
+            reference = make_reference_clip(workspace, duration)
+
+        video_filter = f"{build_transition_filter(duration)},{PUBG_EFFECTS[0]},format=yuv420p"
+
+        for threads in threads_options:
+            for preset in presets:
+                for crf in crfs:
+                    out = workspace.path("bench", "mp4", scratch=True)
+                    workspace.threads = threads
+                    t0 = time.time()
+                    try:
+                        progress = run_media(['ffmpeg', '-y', '-i', str(reference), '-vf', video_filter, '-an',
+                                              *encoder_args({"preset": preset, "crf": crf}), str(out)], workspace)
+                    except MediaError as e:
+                        print(f"   ❌ {preset}/crf{crf}/t{threads}: {e}")
+                        continue
+                    elapsed = time.time() - t0
+                    size = out.stat().st_size
+                    out.unlink()
+
+                    # Productionda shu profil bilan ResourceScheduler aynan shuncha parallel encode beradi
+                    slots, _ = ResourceScheduler.plan(cores, memory, threads, ENCODE_SLOTS)
+                    encode_cost = elapsed / slots
+                    upload_seconds = size * 8 / (upload_mbps * 1e6) / UPLOAD_WORKERS
+                    bottleneck = max(encode_cost, upload_seconds)
+                    row = {
+                        "preset": preset, "crf": crf, "threads": threads, "slots": slots,
+                        "encode_seconds": round(elapsed, 2),
+                        "fps": round(progress["frames"] / elapsed, 1),
+                        "bytes": size,
+                        "upload_seconds": round(upload_seconds, 2),
+                        "videos_per_hour": round(3600 / bottleneck, 1),
+                    }
+                    results.append(row)
+                    print(f"   {preset:>10} crf{crf} t{threads}: {row['fps']:7.1f} fps, "
+                          f"{size / 1048576:6.2f} MB, upload ~{upload_seconds:5.1f}s, "
+                          f"{row['videos_per_hour']:.0f} video/soat")
+    finally:
+        workspace.remove()
+
+    if not results:
+        print("❌ Hech bir kombinatsiya ishlamadi")
+        return None
+
+    best = max(results, key=lambda r: (r["videos_per_hour"], -r["bytes"]))
+    profile = {
+        "preset": best["preset"],
+        "crf": best["crf"],
+        "threads": best["threads"],
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {"cores": cores, "memory_bytes": memory},
+        "reference_seconds": duration,
+        "upload_mbps": upload_mbps,
+        "render_workers": RENDER_WORKERS,
+        "results": results,
+    }
+    print(f"\n🏆 Tanlandi: {best['preset']} crf{best['crf']} t{best['threads']} "
+          f"({best['fps']} fps, {best['bytes'] / 1048576:.2f} MB, ~{best['videos_per_hour']:.0f} video/soat)")
+
+    if write:
+        tmp = ENCODER_PROFILE_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps(profile, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(tmp, ENCODER_PROFILE_PATH)
+        print(f"💾 Profil yozildi: {ENCODER_PROFILE_PATH}")
+    return profile
+
+
+# ============================================
+# PIPELINE BENCHMARK (tashqi servislarsiz)
+# ============================================
+
+BENCH_WORDS = [
+    "sniper", "recoil", "Erangel", "Miramar", "Sanhok", "Livik", "M416", "AWM", "UZI", "DP28",
+    "zone", "squad", "rotation", "grenade", "peek", "loot", "vehicle", "headshot", "sensitivity",
+    "crosshair", "smoke", "bridge", "compound", "airdrop", "bunker", "ridge", "crouch", "prone",
+]
+
+
+class FakeGroq:
+    """Groq o'rnini bosuvchi: kechikish bilan har safar yangi mavzu va script"""
+
+    latency = 0.5
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        time.sleep(self.latency)
+        words = random.sample(BENCH_WORDS, 3)
+        topic = f"{words[0]} {words[1]} {words[2]} drill {uuid.uuid4().hex[:6]}"
+        script = f"Want to win with {' and '.join(words)}? Pros use this every match. Watch till the end and subscribe!"
+        if kwargs.get("response_format"):
+            content = json.dumps({"topic": topic, "script": script})
+        elif kwargs.get("max_tokens", 0) <= 50:
+            content = topic
+        else:
+            content = script
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeCommunicate:
+    """edge_tts.Communicate o'rnini bosuvchi: tayyor mp3 kechikish bilan nusxalanadi"""
+
+    source = None
+    latency = 1.0
+
+    def __init__(self, text, voice, rate=None, pitch=None):
+        self.text = text
+        self.voice = voice
+
+    async def save(self, path):
+        await asyncio.sleep(self.latency)
+        shutil.copyfile(self.source, path)
+
+
+class FakeYoutubeDL:
+    """yt_dlp.YoutubeDL o'rnini bosuvchi: qidiruv natijalari va tayyor klipni tarmoq tezligida "yuklash" """
+
+    full_clip = None
+    section_clip = None
+    latency = 0.3
+    bandwidth = 50e6 / 8  # bayt/s
+
+    def __init__(self, opts=None):
+        self.opts = opts or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, query, download=False):
+        time.sleep(self.latency)
+        entries = []
+        for _ in range(20):
+            video_id = uuid.uuid4().hex[:11]
+            entries.append({
+                "id": video_id,
+                "title": f"PUBG Mobile {random.choice(BENCH_WORDS)} gameplay",
+                "duration": 60,
+                "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+                "width": 1280, "height": 720, "vcodec": "avc1",
+            })
+        return {"entries": entries}
+
+    def download(self, urls):
+        source = self.section_clip if "download_ranges" in self.opts else self.full_clip
+        time.sleep(self.latency + Path(source).stat().st_size / self.bandwidth)
+        shutil.copyfile(source, self.opts["outtmpl"].replace("%(ext)s", "mp4"))
+        return 0
+
+
+class FakeUploadHttp:
+    """YouTube resumable upload protokolini taqlid qiluvchi httplib2.Http (POST sessiya, PUT chunklar)"""
+
+    def __init__(self, bandwidth, latency=0.1):
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._received = {}  # sessiya URI -> qabul qilingan baytlar
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        time.sleep(self.latency)
+        if method == "POST":
+            session_uri = f"https://upload.bench.invalid/{uuid.uuid4().hex}"
+            with self._lock:
+                self._received[session_uri] = 0
+            return httplib2.Response({"status": 200, "location": session_uri}), b""
+
+        data = body.read() if hasattr(body, "read") else (body or b"")
+        time.sleep(len(data) / self.bandwidth)
+        total = int(headers.get("content-range", "*/0").rsplit("/", 1)[1])
+        with self._lock:
+            self._received[uri] = self._received.get(uri, 0) + len(data)
+            received = self._received[uri]
+        if received < total:
+            return httplib2.Response({"status": 308, "range": f"bytes=0-{received - 1}"}), b""
+        return httplib2.Response({"status": 200}), json.dumps({"id": f"bench{uuid.uuid4().hex[:6]}"}).encode()
+
+
+if GOOGLE_AVAILABLE:
+    class BenchYouTubeClient(YouTubeClient):
+        """Token yangilanmaydigan, soxta HTTP orqali yuklaydigan klient"""
+
+        def __init__(self, http):
+            super().__init__(0)
+            self._fake_http = http
+
+        def credentials(self):
+            with self._lock:
+                if self._creds is None:
+                    self._creds = Credentials(token="bench")
+                return self._creds
+
+        def http(self):
+            return self._fake_http
+
+
+def make_bench_media(workspace, voice_seconds=12):
+    """lavfi dan tayyor media: 60s gameplay, section-download bo'lagi va ovoz"""
+    full = workspace.path("gameplay", "mp4")
+    run_media([
+        'ffmpeg', '-y',
+        '-f', 'lavfi', '-i', 'testsrc2=s=1280x720:r=30:d=60,noise=alls=8:allf=t',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:d=60',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest',
+        str(full)
+    ], workspace, duration=60)
+    section = workspace.path("section", "mp4")
+    run_media(['ffmpeg', '-y', '-i', str(full), '-t', str(SOURCE_CLIP_SECONDS + SECTION_MARGIN_SECONDS),
+               '-c', 'copy', str(section)], workspace)
+    voice = workspace.path("voice", "mp3")
+    run_media([
+        'ffmpeg', '-y',
+        '-f', 'lavfi', '-i', f'sine=frequency=220:d={voice_seconds}',
+        '-c:a', 'libmp3lame', '-b:a', '64k',
+        str(voice)
+    ], workspace)
+    return {"full": full, "section": section, "voice": voice}
+
+
+def install_bench_fakes(media, llm_latency, tts_latency, search_latency, download_mbps, upload_mbps):
+    """Tashqi servislarni soxtalari bilan almashtirish (faqat benchmark jarayonida)"""
+    global GROQ_AVAILABLE, GROQ_API_KEY, groq_client, youtube_client
+    global GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REFRESH_TOKEN
+
+    FakeGroq.latency = llm_latency
+    GROQ_AVAILABLE, GROQ_API_KEY = True, "bench"
+    groq_client = FakeGroq()
+
+    FakeCommunicate.source = media["voice"]
+    FakeCommunicate.latency = tts_latency
+    edge_tts.Communicate = FakeCommunicate
+
+    FakeYoutubeDL.full_clip = media["full"]
+    FakeYoutubeDL.section_clip = media["section"]
+    FakeYoutubeDL.latency = search_latency
+    FakeYoutubeDL.bandwidth = download_mbps * 1e6 / 8
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+
+    if GOOGLE_AVAILABLE:
+        GOOGLE_CLIENT_ID = GOOGLE_CLIENT_SECRET = GOOGLE_REFRESH_TOKEN = "bench"
+        youtube_client = BenchYouTubeClient(FakeUploadHttp(upload_mbps * 1e6 / 8))
+    else:
+        print("⚠️ google-api yo'q - upload bosqichi demo URL bilan o'tadi")
+
+
+def read_io_counters():
+    """/proc/self/io (Linux): kutib olingan ffmpeg jarayonlarining yozuvlari ham shu yerga qo'shiladi"""
+    try:
+        with open("/proc/self/io") as f:
+            return {key.strip(): int(value) for key, value in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+
+def peak_rss_mb():
+    """(bot jarayoni, eng katta bola jarayon) peak RSS, MB; resource yo'q bo'lsa None"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1 if sys.platform == "darwin" else 1024  # Linux: KB, macOS: bayt
+    return tuple(round(resource.getrusage(who).ru_maxrss * scale / 1048576, 1)
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def percentiles(values):
+    """Nearest-rank p50/p90/p95 va max"""
+    ordered = sorted(values)
+
+    def pick(pct):
+        return ordered[max(0, -(-pct * len(ordered) // 100) - 1)]
+
+    return {"n": len(ordered), "p50": pick(50), "p90": pick(90), "p95": pick(95), "max": ordered[-1]}
+
+
+def benchmark_pipeline(jobs=6, concurrency=None, upload_workers=None, llm_latency=0.5, tts_latency=1.0,
+                       search_latency=0.3, download_mbps=50, upload_mbps=UPLOAD_MBPS, timeout=1800):
+    """
+    process_video oqimini tashqi servislarsiz o'lchash
+    - Groq, edge-tts, yt-dlp va YouTube upload soxta: kechikish va tarmoq tezligi taqlid qilinadi
+    - Render yo'li haqiqiy: ffmpeg, encoder profili, resurs rejalovchi, worker navbatlari
+    - Natija: bosqichlar bo'yicha persentillar, video/soat, peak RSS, diskka yozilgan baytlar
+    - Zaxira yo'llar (fallback, ffmpeg xatolari) va har ishning render yo'li alohida sanaladi:
+      oddiy montajga tushib "muvaffaqiyatli" bo'lgan ish ham regressiya
+    """
+    concurrency = concurrency or RENDER_WORKERS
+    media_workspace = JobWorkspace("bench-media", ephemeral=False)
+    print("🎞️ Soxta media tayyorlanmoqda...")
+    media = make_bench_media(media_workspace)
+    install_bench_fakes(media, llm_latency, tts_latency, search_latency, download_mbps, upload_mbps)
+
+    fallbacks_before = metrics.counters("pubg_fallback_total")
+    failures_before = metrics.counters("pubg_ffmpeg_failures_total")
+    io_before = read_io_counters()
+    t0 = time.time()
+    start_workers(count=concurrency, upload_count=upload_workers)
+    submitted = {submit_job(source="bench"): time.time() for _ in range(jobs)}
+    latencies = {}
+    while len(latencies) < len(submitted) and time.time() - t0 < timeout:
+        seq = bot_status.seq
+        for job_id, job in bot_status.jobs().items():
+            if job_id in submitted and job["finished"] and job_id not in latencies:
+                latencies[job_id] = time.time() - submitted[job_id]
+        bot_status.wait_for_change(seq, 1.0)
+    wall = time.time() - t0
+    shutdown_workers()
+    io_after = read_io_counters()
+    rss_self, rss_children = peak_rss_mb()
+
+    samples = {"total": list(latencies.values())}
+    succeeded = degraded = 0
+    render_paths = {}
+    expected_path = "single_pass" if SINGLE_PASS_RENDER else "multi_pass"
+    for job_id in latencies:
+        job = bot_status.job(job_id)
+        succeeded += job["status"] == "success"
+        path = job.get("render_path") or "none"
+        render_paths[path] = render_paths.get(path, 0) + 1
+        degraded += job["status"] == "success" and path != expected_path
+        for stage, seconds in (job.get("timings") or {}).items():
+            if seconds is not None:
+                samples.setdefault(stage, []).append(seconds)
+
+    report = {
+        "jobs": jobs,
+        "succeeded": succeeded,
+        "failed": jobs - succeeded,
+        "concurrency": concurrency,
+        "upload_workers": upload_workers or UPLOAD_WORKERS,
+        "wall_seconds": round(wall, 1),
+        "videos_per_hour": round(succeeded * 3600 / wall, 1) if wall > 0 else 0,
+        "degraded": degraded,
+        "render_paths": render_paths,
+        "fallbacks": counter_delta(fallbacks_before, metrics.counters("pubg_fallback_total")),
+        "ffmpeg_failures": counter_delta(failures_before, metrics.counters("pubg_ffmpeg_failures_total")),
+        "stages": {name: {k: round(v, 2) for k, v in percentiles(values).items()}
+                   for name, values in samples.items() if values},
+        "peak_rss_mb": rss_self,
+        "peak_child_rss_mb": rss_children,
+        "disk_write_bytes": io_after.get("write_bytes", 0) - io_before.get("write_bytes", 0) if io_after else None,
+        "wchar_bytes": io_after.get("wchar", 0) - io_before.get("wchar", 0) if io_after else None,
+        "encoder": {k: encoder_profile[k] for k in ("preset", "crf", "threads")},
+        "slots": resource_scheduler.slots,
+        "cores": detect_cpu_count(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    media_workspace.remove()
+    print_bench_report(report)
+    return report
+
+
+def counter_delta(before, after):
+    """Ikki counters() o'lchovi farqi (faqat o'zgarganlari)"""
+    delta = {k: v - before.get(k, 0) for k, v in after.items()}
+    return {k: v for k, v in delta.items() if v}
+
+
+def bench_problems(report):
+    """Natijaning o'zidagi muammolar: xato, zaxira yo'llar, ffmpeg xatolari"""
+    problems = []
+    if report["failed"]:
+        problems.append(f"{report['failed']} ta ish muvaffaqiyatsiz")
+    if report["degraded"]:
+        problems.append(f"{report['degraded']} ta ish zaxira render yo'lida: {report['render_paths']}")
+    if report["fallbacks"]:
+        problems.append(f"zaxira yo'llar: {report['fallbacks']}")
+    if report["ffmpeg_failures"]:
+        problems.append(f"ffmpeg xatolari: {report['ffmpeg_failures']}")
+    return problems
+
+
+def print_bench_report(report):
+    print("\n" + "=" * 70)
+    print(f"📊 {report['succeeded']}/{report['jobs']} video, {report['concurrency']} render + "
+          f"{report['upload_workers']} upload worker, {report['wall_seconds']}s")
+    print(f"   🚀 {report['videos_per_hour']} video/soat")
+    paths = ", ".join(f"{k} {v}" for k, v in report["render_paths"].items())
+    print(f"   🎬 Render yo'li: {paths or '-'}")
+    if report["fallbacks"] or report["ffmpeg_failures"]:
+        print(f"   ⚠️ Zaxira yo'llar: {report['fallbacks']}, ffmpeg xatolari: {report['ffmpeg_failures']}")
+    print(f"   {'bosqich':>10} {'n':>4} {'p50':>8} {'p90':>8} {'p95':>8} {'max':>8}")
+    for name, row in report["stages"].items():
+        print(f"   {name:>10} {row['n']:>4} {row['p50']:>8.2f} {row['p90']:>8.2f} {row['p95']:>8.2f} {row['max']:>8.2f}")
+    print(f"   🧠 Peak RSS: bot {report['peak_rss_mb']} MB, eng katta ffmpeg {report['peak_child_rss_mb']} MB")
+    if report["disk_write_bytes"] is not None:
+        print(f"   💾 Diskka yozildi: {report['disk_write_bytes'] / 1048576:.1f} MB "
+              f"(write() orqali {report['wchar_bytes'] / 1048576:.1f} MB)")
+    print("=" * 70)
+
+
+def compare_bench(report, baseline, tolerance):
+    """Oldingi natija bilan solishtirish; chegaradan oshgan regressiyalar ro'yxati"""
+    problems = []
+    old_rate = baseline.get("videos_per_hour") or 0
+    if old_rate and report["videos_per_hour"] < old_rate * (1 - tolerance):
+        problems.append(f"video/soat {old_rate} → {report['videos_per_hour']}")
+    for name in ("render", "total"):
+        old_p95 = baseline.get("stages", {}).get(name, {}).get("p95")
+        new_p95 = report["stages"].get(name, {}).get("p95")
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + tolerance):
+            problems.append(f"{name} p95 {old_p95}s → {new_p95}s")
+    for key in ("degraded", "fallbacks", "ffmpeg_failures"):
+        old = baseline.get(key) or 0
+        new = report.get(key) or 0
+        old_n = sum(old.values()) if isinstance(old, dict) else old
+        new_n = sum(new.values()) if isinstance(new, dict) else new
+        if new_n > old_n:
+            problems.append(f"{key} {old_n} → {new_n}")
+    return problems
+
+
+def run_isolated_bench(argv, keep=False, concurrency=None):
+    """
+    Benchmarkni vaqtinchalik DATA_DIR / OUTPUT_DIR bilan alohida jarayonda ishga tushirish
+    - Haqiqiy ishlar bazasi, keshlar va kutubxonaga tegilmaydi
+    - Encoder profili nusxalanadi - render yo'li productiondagi sozlama bilan o'lchanadi
+    """
+    root = Path(tempfile.mkdtemp(prefix="pubg-bench-"))
+    (root / "data").mkdir()
+    if ENCODER_PROFILE_PATH.exists():
+        shutil.copyfile(ENCODER_PROFILE_PATH, root / "data" / ENCODER_PROFILE_PATH.name)
+    env = dict(os.environ, PIPELINE_BENCH="1", DATA_DIR=str(root / "data"), OUTPUT_DIR=str(root / "output"))
+    env.pop("WORKSPACE_DIR", None)
+    if concurrency:
+        # Encode slotlari import paytida RENDER_WORKERS dan hisoblanadi
+        env["RENDER_WORKERS"] = str(concurrency)
+    try:
+        return subprocess.call([sys.executable, str(Path(__file__).resolve()), *argv], env=env)
+    finally:
+        if keep:
+            print(f"📁 Benchmark fayllari: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
 # ============================================
 # MAIN
 # ============================================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PUBG YouTube Shorts Bot")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("serve", help="Web server va worker'lar (standart)")
+
+    bench = sub.add_parser("bench-encoder", help="x264 profilini shu hostda o'lchab tanlash")
+    bench.add_argument("--source", help="Referens video (berilmasa sintetik klip)")
+    bench.add_argument("--duration", type=int, default=15, help="Sintetik klip uzunligi (s)")
+    bench.add_argument("--presets", nargs="+", default=BENCH_PRESETS)
+    bench.add_argument("--crf", nargs="+", type=int, default=BENCH_CRFS)
+    bench.add_argument("--threads", nargs="+", type=int, help="Sinaladigan thread sonlari")
+    bench.add_argument("--upload-mbps", type=float, default=UPLOAD_MBPS)
+    bench.add_argument("--dry-run", action="store_true", help="Profilni faylga yozmaslik")
+
+    pipe = sub.add_parser("bench-pipeline", help="To'liq oqimni soxta tashqi servislar bilan o'lchash")
+    pipe.add_argument("--jobs", type=int, default=6, help="Ishlar soni")
+    pipe.add_argument("--concurrency", type=int, help="Render worker'lar (standart RENDER_WORKERS)")
+    pipe.add_argument("--upload-workers", type=int, help="Upload worker'lar (standart UPLOAD_WORKERS)")
+    pipe.add_argument("--llm-latency", type=float, default=0.5, help="Groq javob vaqti (s)")
+    pipe.add_argument("--tts-latency", type=float, default=1.0, help="Edge-TTS sintez vaqti (s)")
+    pipe.add_argument("--search-latency", type=float, default=0.3, help="yt-dlp qidiruv/so'rov vaqti (s)")
+    pipe.add_argument("--download-mbps", type=float, default=50)
+    pipe.add_argument("--upload-mbps", type=float, default=UPLOAD_MBPS)
+    pipe.add_argument("--timeout", type=int, default=1800, help="Umumiy vaqt chegarasi (s)")
+    pipe.add_argument("--json", help="Natijani JSON faylga yozish")
+    pipe.add_argument("--baseline", help="Oldingi --json natija: regressiya bo'lsa chiqish kodi 1")
+    pipe.add_argument("--tolerance", type=float, default=0.15, help="Ruxsat etilgan yomonlashish ulushi")
+    pipe.add_argument("--keep", action="store_true", help="Vaqtinchalik fayllarni o'chirmaslik")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "bench-encoder":
+        if not FFMPEG_AVAILABLE:
+            print("❌ ffmpeg o'rnatilmagan!")
+            sys.exit(1)
+        profile = benchmark_encoder(source=args.source, duration=args.duration, presets=args.presets,
+                                    crfs=args.crf, threads_options=args.threads,
+                                    upload_mbps=args.upload_mbps, write=not args.dry_run)
+        sys.exit(0 if profile else 1)
+
+    if args.command == "bench-pipeline":
+        if not FFMPEG_AVAILABLE:
+            print("❌ ffmpeg o'rnatilmagan!")
+            sys.exit(1)
+        if not os.getenv("PIPELINE_BENCH"):
+            sys.exit(run_isolated_bench(sys.argv[1:] if argv is None else argv, keep=args.keep,
+                                        concurrency=args.concurrency))
+        report = benchmark_pipeline(jobs=args.jobs, concurrency=args.concurrency,
+                                    upload_workers=args.upload_workers, llm_latency=args.llm_latency,
+                                    tts_latency=args.tts_latency, search_latency=args.search_latency,
+                                    download_mbps=args.download_mbps, upload_mbps=args.upload_mbps,
+                                    timeout=args.timeout)
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+            print(f"💾 Natija yozildi: {args.json}")
+        problems = bench_problems(report)
+        if args.baseline:
+            baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+            problems += compare_bench(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"❌ Regressiya: {problem}")
+        sys.exit(1 if problems else 0)
+
     print("\n" + "=" * 70)
     print("🎮  PUBG AI BOT v9.4 — TO'LIQ ISHLAYDI")
     print("=" * 70)
@@ -1242,10 +4500,14 @@ def main():
     print(f"  ✅ Transition fade in/out")
     print(f"  ✅ PUBG style matn (oq rang, qora kontur)")
     print(f"  ✅ Ovoz tizimi (3 marta urinish + sun'iy ovoz)")
+    print(f"  🎛️ Encoder: {encoder_profile['preset']} crf{encoder_profile['crf']}, "
+          f"{resource_scheduler.slots} slot x {resource_scheduler.threads} thread")
     print("=" * 70 + "\n")
 
     create_html_template()
-    threading.Thread(target=worker, daemon=True).start()
+    recover_jobs()
+    start_workers()
+    warm_pool.start()
     threading.Thread(target=run_scheduler, daemon=True).start()
 
     port = int(os.environ.get("PORT", 5000))